@@ -0,0 +1,61 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import threading
+import time
+
+class DedupCache(object):
+  """LRU cache with a TTL that remembers recently handled keys.
+
+  `claim(key)` atomically records the key and returns True the first time
+  it is seen within `ttl` seconds, and False for duplicates, so concurrent
+  retries of the same request cannot both get through. `release(key)`
+  forgets a key whose processing failed so that a retry can claim it again.
+  At most `maxsize` keys are kept; the least recently claimed are evicted
+  first.
+  """
+
+  def __init__(self, maxsize=10000, ttl=600.0, clock=time.monotonic):
+    self.maxsize = maxsize
+    self.ttl = ttl
+    self._clock = clock
+    self._entries = collections.OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+
+  def claim(self, key):
+    now = self._clock()
+    with self._lock:
+      expires_at = self._entries.get(key)
+      if expires_at is not None and expires_at > now:
+        self.hits += 1
+        return False
+      self.misses += 1
+      self._entries[key] = now + self.ttl
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.maxsize:
+        self._entries.popitem(last=False)
+      return True
+
+  def release(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def stats(self):
+    with self._lock:
+      return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
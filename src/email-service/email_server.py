@@ -14,116 +14,151 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from concurrent import futures
 import argparse
 import os
 import sys
 import time
 import grpc
-import traceback
-from jinja2 import Environment, FileSystemLoader, select_autoescape, TemplateError
-from google.api_core.exceptions import GoogleAPICallError
-from google.auth.exceptions import DefaultCredentialsError
+from jinja2 import TemplateError
 
 import demo_pb2
 import demo_pb2_grpc
-from grpc_health.v1 import health_pb2
-from grpc_health.v1 import health_pb2_grpc
-
-from opentelemetry import trace
-from opentelemetry.instrumentation.grpc import GrpcInstrumentorServer
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-
-import googlecloudprofiler
-
-from logger import getJSONLogger
+from service_runtime import metrics, prefork, server_config
+from service_runtime.health import HealthCheckMixin, add_health_servicer
+from service_runtime.logger import getJSONLogger
+from service_runtime.profiling import init_profiling
+from service_runtime.tracing import init_tracing
+
+from confirmation_renderer import ConfirmationRenderer
+from dedup_cache import DedupCache
+from send_queue import EmailMessage, FileSink, InMemorySink, SendQueue
+from smtp_sender import SMTPSender
 logger = getJSONLogger('emailservice-server')
 
-# Loads confirmation email template from file
-env = Environment(
-    loader=FileSystemLoader('templates'),
-    autoescape=select_autoescape(['html', 'xml'])
-)
-template = env.get_template('confirmation.html')
-
-class BaseEmailService(demo_pb2_grpc.EmailServiceServicer):
-  def Check(self, request, context):
-    return health_pb2.HealthCheckResponse(
-      status=health_pb2.HealthCheckResponse.SERVING)
-  
-  def Watch(self, request, context):
-    return health_pb2.HealthCheckResponse(
-      status=health_pb2.HealthCheckResponse.UNIMPLEMENTED)
+# Loads confirmation email templates, precompiled ones first if available
+renderer = ConfirmationRenderer(
+  item_cache_size=int(os.environ.get('EMAIL_ITEM_ROW_CACHE_SIZE', '1024')))
+
+class BaseEmailService(HealthCheckMixin, demo_pb2_grpc.EmailServiceServicer):
+  pass
 
 class EmailService(BaseEmailService):
-  def __init__(self):
-    raise Exception('cloud mail client not implemented')
-    super().__init__()
+  """Renders confirmation emails and hands them to a SendQueue.
 
-  @staticmethod
-  def send_email(client, email_address, content):
-    response = client.send_message(
-      sender = client.sender_path(project_id, region, sender_id),
-      envelope_from_authority = '',
-      header_from_authority = '',
-      envelope_from_address = from_address,
-      simple_message = {
-        "from": {
-          "address_spec": from_address,
-        },
-        "to": [{
-          "address_spec": email_address
-        }],
-        "subject": "Your Confirmation Email",
-        "html_body": content
-      }
-    )
-    logger.info("Message sent: {}".format(response.rfc822_message_id))
+  The RPC returns as soon as the message is queued, so checkout latency
+  does not include the mail provider's latency.
+  """
+  def __init__(self, send_queue, dedup_cache=None):
+    super().__init__()
+    self.send_queue = send_queue
+    self.dedup_cache = dedup_cache
 
   def SendOrderConfirmation(self, request, context):
     email = request.email
     order = request.order
 
+    # Checkout retries resend the same order; skip those before rendering.
+    dedup_key = None
+    if self.dedup_cache is not None and order.order_id:
+      dedup_key = (order.order_id, email)
+      if not self.dedup_cache.claim(dedup_key):
+        logger.info('Skipping duplicate order confirmation for order %s.', order.order_id)
+        return demo_pb2.Empty()
+
+    # From here on, any failure must release the claim, or the checkout
+    # retry would be skipped as a duplicate and no email would be sent.
     try:
-      confirmation = template.render(order = order)
+      confirmation = renderer.render(order)
+      queued = self.send_queue.submit(EmailMessage(email, "Your Confirmation Email", confirmation))
     except TemplateError as err:
+      self._release(dedup_key)
       context.set_details("An error occurred when preparing the confirmation mail.")
       logger.error(err.message)
       context.set_code(grpc.StatusCode.INTERNAL)
       return demo_pb2.Empty()
-
-    try:
-      EmailService.send_email(self.client, email, confirmation)
-    except GoogleAPICallError as err:
-      context.set_details("An error occurred when sending the email.")
-      print(err.message)
-      context.set_code(grpc.StatusCode.INTERNAL)
+    except BaseException:
+      self._release(dedup_key)
+      raise
+
+    if not queued:
+      self._release(dedup_key)
+      if self.send_queue.stopping:
+        # Another replica can take the retry.
+        context.set_details("The email service is shutting down.")
+        context.set_code(grpc.StatusCode.UNAVAILABLE)
+      else:
+        context.set_details("The email send queue is full.")
+        context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
       return demo_pb2.Empty()
 
     return demo_pb2.Empty()
 
+  def _release(self, dedup_key):
+    if dedup_key is not None:
+      self.dedup_cache.release(dedup_key)
+
 class DummyEmailService(BaseEmailService):
   def SendOrderConfirmation(self, request, context):
-    logger.info('A request to send order confirmation email to {} has been received.'.format(request.email))
+    logger.info('A request to send order confirmation email to %s has been received.', request.email)
     return demo_pb2.Empty()
 
-class HealthCheck():
-  def Check(self, request, context):
-    return health_pb2.HealthCheckResponse(
-      status=health_pb2.HealthCheckResponse.SERVING)
-
-def start(dummy_mode):
-  server = grpc.server(futures.ThreadPoolExecutor(max_workers=10),)
+def new_sender(name):
+  if name == 'memory':
+    return InMemorySink()
+  if name == 'file':
+    return FileSink(os.environ.get('EMAIL_SINK_FILE', 'sent_emails.jsonl'))
+  if name == 'smtp':
+    return SMTPSender(
+      host=os.environ['SMTP_HOST'],
+      port=int(os.environ.get('SMTP_PORT', '587')),
+      from_address=os.environ.get('EMAIL_FROM_ADDRESS', 'noreply@example.com'),
+      username=os.environ.get('SMTP_USERNAME'),
+      password=os.environ.get('SMTP_PASSWORD'),
+      security=os.environ.get('SMTP_SECURITY', 'starttls'),
+      pool_size=int(os.environ.get('SMTP_POOL_SIZE', os.environ.get('EMAIL_SENDER_WORKERS', '2'))),
+      timeout=float(os.environ.get('SMTP_TIMEOUT_SECONDS', '10')))
+  raise Exception('unknown EMAIL_SENDER "{}"'.format(name))
+
+def new_send_queue(sender):
+  return SendQueue(
+    sender,
+    maxsize=int(os.environ.get('EMAIL_QUEUE_SIZE', '1000')),
+    workers=int(os.environ.get('EMAIL_SENDER_WORKERS', '2')),
+    batch_size=int(os.environ.get('EMAIL_BATCH_SIZE', '20')),
+    batch_timeout=float(os.environ.get('EMAIL_BATCH_TIMEOUT_SECONDS', '0.05')),
+    stats_interval=float(os.environ.get('EMAIL_QUEUE_STATS_INTERVAL_SECONDS', '60')),
+    max_attempts=int(os.environ.get('EMAIL_SEND_ATTEMPTS', '3')),
+    retry_delay=float(os.environ.get('EMAIL_RETRY_DELAY_SECONDS', '1')))
+
+def new_dedup_cache():
+  size = int(os.environ.get('EMAIL_DEDUP_CACHE_SIZE', '10000'))
+  if size <= 0:
+    return None
+  return DedupCache(maxsize=size, ttl=float(os.environ.get('EMAIL_DEDUP_TTL_SECONDS', '600')))
+
+def drain_timeout():
+  # Leave some of the supervisor's grace period for stopping the server and exiting.
+  default = max(prefork.shutdown_grace() - 2, 0)
+  return float(os.environ.get('EMAIL_QUEUE_DRAIN_SECONDS', default))
+
+def start(sender_name):
+  server = server_config.new_server(
+    interceptors=metrics.server_interceptors(),
+    executor=metrics.new_executor(server_config.max_workers()))
   service = None
-  if dummy_mode:
+  send_queue = None
+  if sender_name == 'dummy':
     service = DummyEmailService()
   else:
-    raise Exception('non-dummy mode not implemented yet')
+    send_queue = new_send_queue(new_sender(sender_name))
+    dedup_cache = new_dedup_cache()
+    if dedup_cache is not None:
+      send_queue.add_stats_source('dedup', dedup_cache.stats)
+    send_queue.start()
+    service = EmailService(send_queue, dedup_cache)
 
   demo_pb2_grpc.add_EmailServiceServicer_to_server(service, server)
-  health_pb2_grpc.add_HealthServicer_to_server(service, server)
+  add_health_servicer(service, server)
 
   port = os.environ.get('PORT', "8080")
   logger.info("listening on port: "+port)
@@ -133,66 +168,26 @@ def start(dummy_mode):
     while True:
       time.sleep(3600)
   except KeyboardInterrupt:
+    # Raised on SIGTERM too, see prefork.run(). RPCs were answered before
+    # their emails were sent, so the queue is drained before exiting.
     server.stop(0)
+    if send_queue is not None:
+      send_queue.stop(timeout=drain_timeout())
+      if hasattr(send_queue.sender, 'close'):
+        send_queue.sender.close()
 
-def initStackdriverProfiling():
-  project_id = None
-  try:
-    project_id = os.environ["GCP_PROJECT_ID"]
-  except KeyError:
-    # Environment variable not set
-    pass
+def main():
+  """Initializes profiling, tracing and metrics, then runs the server until it stops.
 
-  for retry in range(1,4):
-    try:
-      if project_id:
-        googlecloudprofiler.start(service='email_server', service_version='1.0.0', verbose=0, project_id=project_id)
-      else:
-        googlecloudprofiler.start(service='email_server', service_version='1.0.0', verbose=0)
-      logger.info("Successfully started Stackdriver Profiler.")
-      return
-    except (BaseException) as exc:
-      logger.info("Unable to start Stackdriver Profiler Python agent. " + str(exc))
-      if (retry < 4):
-        logger.info("Sleeping %d to retry initializing Stackdriver Profiler"%(retry*10))
-        time.sleep (1)
-      else:
-        logger.warning("Could not initialize Stackdriver Profiler after retrying, giving up")
-  return
+  Called once per process, so every pre-forked worker sets up its own
+  profiler agent and span exporter.
+  """
+  init_profiling('email_server')
+  init_tracing()
+  metrics.init_metrics()
 
+  start(os.environ.get('EMAIL_SENDER', 'dummy'))
 
 if __name__ == '__main__':
-  logger.info('starting the email service in dummy mode.')
-
-  # Profiler
-  try:
-    if "DISABLE_PROFILER" in os.environ:
-      raise KeyError()
-    else:
-      logger.info("Profiler enabled.")
-      initStackdriverProfiling()
-  except KeyError:
-      logger.info("Profiler disabled.")
-
-  # Tracing
-  try:
-    if os.environ["ENABLE_TRACING"] == "1":
-      otel_endpoint = os.getenv("COLLECTOR_SERVICE_ADDR", "localhost:4317")
-      trace.set_tracer_provider(TracerProvider())
-      trace.get_tracer_provider().add_span_processor(
-        BatchSpanProcessor(
-            OTLPSpanExporter(
-            endpoint = otel_endpoint,
-            insecure = True
-          )
-        )
-      )
-    grpc_server_instrumentor = GrpcInstrumentorServer()
-    grpc_server_instrumentor.instrument()
-
-  except (KeyError, DefaultCredentialsError):
-      logger.info("Tracing disabled.")
-  except Exception as e:
-      logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.") 
-  
-  start(dummy_mode = True)
+  logger.info('starting the email service with the {} sender.'.format(os.environ.get('EMAIL_SENDER', 'dummy')))
+  prefork.run(main, prefork.processes())
@@ -0,0 +1,265 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bounded in-process queue that sends emails in batches off the RPC path.
+
+Senders implement `send_batch(messages)`, which returns the messages that
+could not be sent (None when all were) and raises if it could not handle the
+batch at all. Besides the real backends, InMemorySink and FileSink can stand
+in for a mail provider in tests and benchmarks.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from service_runtime.logger import getJSONLogger
+logger = getJSONLogger('emailservice-queue')
+
+class EmailMessage(object):
+  __slots__ = ('to', 'subject', 'html_body', 'accepted_at', 'attempts', 'rejected')
+
+  def __init__(self, to, subject, html_body):
+    self.to = to
+    self.subject = subject
+    self.html_body = html_body
+    self.accepted_at = None
+    self.attempts = 0
+    # Set by senders to the reason a message must not be sent again
+    self.rejected = None
+
+class InMemorySink(object):
+  """Keeps sent messages in a list."""
+  def __init__(self):
+    self.messages = []
+    self._lock = threading.Lock()
+
+  def send_batch(self, messages):
+    with self._lock:
+      self.messages.extend(messages)
+
+class FileSink(object):
+  """Appends sent messages to a file, one JSON object per line."""
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+
+  def send_batch(self, messages):
+    lines = ''.join(json.dumps({'to': m.to, 'subject': m.subject, 'html_body': m.html_body}) + '\n'
+                    for m in messages)
+    with self._lock:
+      with open(self.path, 'a') as f:
+        f.write(lines)
+
+class _LatencyStats(object):
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+  def add(self, seconds):
+    self.count += 1
+    self.total += seconds
+    self.max = max(self.max, seconds)
+
+  def as_dict(self):
+    return {
+      'avg_ms': round(1000 * self.total / self.count, 3) if self.count else 0.0,
+      'max_ms': round(1000 * self.max, 3),
+    }
+
+class SendQueue(object):
+  """Accepts messages without blocking and sends them from a worker pool.
+
+  `submit` returns False, and counts a drop, when `maxsize` messages are
+  already waiting. Each worker takes up to `batch_size` messages, waiting
+  at most `batch_timeout` seconds for a batch to fill, and hands them to
+  the sender in one `send_batch` call.
+
+  Messages that fail are queued again after `retry_delay` seconds, doubling
+  with each attempt, until `max_attempts` sends have failed. Messages that
+  the sender marked `rejected` failed for good and are not sent again.
+  Each message that is given up on is logged with its recipient.
+  """
+
+  def __init__(self, sender, maxsize=1000, workers=2, batch_size=20, batch_timeout=0.05,
+               stats_interval=60.0, max_attempts=3, retry_delay=1.0):
+    self.sender = sender
+    self.batch_size = batch_size
+    self.batch_timeout = batch_timeout
+    self.max_attempts = max_attempts
+    self.retry_delay = retry_delay
+    self.stats_interval = stats_interval
+    self._queue = queue.Queue(maxsize=maxsize)
+    self._num_workers = workers
+    self._threads = []
+    self._stopping = threading.Event()
+    self._lock = threading.Lock()
+    self._accepted = 0
+    self._dropped = 0
+    self._sent = 0
+    self._failed = 0
+    self._retried = 0
+    self._retrying = 0
+    self._send_latency = _LatencyStats()
+    self._delivery_latency = _LatencyStats()
+    self._stats_sources = {}
+
+  def add_stats_source(self, name, stats):
+    """Includes `stats()` under `name` in the periodic stats log."""
+    self._stats_sources[name] = stats
+
+  def start(self):
+    for i in range(self._num_workers):
+      thread = threading.Thread(target=self._run, name='email-sender-%d' % i, daemon=True)
+      thread.start()
+      self._threads.append(thread)
+    if self.stats_interval:
+      thread = threading.Thread(target=self._report, name='email-queue-stats', daemon=True)
+      thread.start()
+
+  def stop(self, timeout=None):
+    """Stops accepting messages and waits for the queued ones, and pending retries, to be sent.
+
+    `timeout` bounds the whole wait, not the wait for each sender thread.
+    Messages still unsent when it expires are logged as lost.
+    """
+    self._stopping.set()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for thread in self._threads:
+      thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+    self._threads = []
+    with self._lock:
+      unsent = self._queue.qsize() + self._retrying
+    if unsent:
+      logger.error("Stopped with {} emails not sent".format(unsent))
+
+  @property
+  def stopping(self):
+    """True once stop() was called; `submit` then rejects every message."""
+    return self._stopping.is_set()
+
+  def submit(self, message):
+    if self._stopping.is_set():
+      return False
+    message.accepted_at = time.monotonic()
+    try:
+      self._queue.put_nowait(message)
+    except queue.Full:
+      with self._lock:
+        self._dropped += 1
+      return False
+    with self._lock:
+      self._accepted += 1
+    return True
+
+  def stats(self):
+    with self._lock:
+      return {
+        'depth': self._queue.qsize(),
+        'accepted': self._accepted,
+        'dropped': self._dropped,
+        'sent': self._sent,
+        'retried': self._retried,
+        'failed': self._failed,
+        'send_latency': self._send_latency.as_dict(),
+        'delivery_latency': self._delivery_latency.as_dict(),
+      }
+
+  def _next_batch(self):
+    try:
+      batch = [self._queue.get(timeout=0.5)]
+    except queue.Empty:
+      return []
+    deadline = time.monotonic() + self.batch_timeout
+    while len(batch) < self.batch_size:
+      remaining = deadline - time.monotonic()
+      try:
+        if remaining > 0:
+          batch.append(self._queue.get(timeout=remaining))
+        else:
+          batch.append(self._queue.get_nowait())
+      except queue.Empty:
+        break
+    return batch
+
+  def _done(self):
+    with self._lock:
+      retrying = self._retrying
+    return self._stopping.is_set() and self._queue.empty() and not retrying
+
+  def _give_up(self, message, reason):
+    logger.error("Giving up on email to {} after {} attempts: {}".format(message.to, message.attempts, reason))
+    with self._lock:
+      self._failed += 1
+
+  def _retry_later(self, messages):
+    retry = {}
+    for message in messages:
+      message.attempts += 1
+      if message.rejected is not None:
+        self._give_up(message, message.rejected)
+      elif message.attempts < self.max_attempts:
+        retry.setdefault(message.attempts, []).append(message)
+      else:
+        self._give_up(message, 'sending failed')
+    # A batch can mix first sends and retries, which back off differently.
+    for attempts, group in retry.items():
+      with self._lock:
+        self._retried += len(group)
+        self._retrying += len(group)
+      timer = threading.Timer(self.retry_delay * 2 ** (attempts - 1), self._requeue, [group])
+      timer.daemon = True
+      timer.start()
+
+  def _requeue(self, messages):
+    for message in messages:
+      try:
+        self._queue.put_nowait(message)
+      except queue.Full:
+        self._give_up(message, 'the queue is full')
+      with self._lock:
+        self._retrying -= 1
+
+  def _run(self):
+    while not self._done():
+      batch = self._next_batch()
+      if not batch:
+        continue
+      started = time.monotonic()
+      try:
+        failed = self.sender.send_batch(batch) or []
+      except Exception as err:
+        failed = batch
+        logger.error("Failed to send {} emails: {}".format(len(batch), err))
+      finished = time.monotonic()
+      failed_ids = set(map(id, failed))
+      with self._lock:
+        self._send_latency.add(finished - started)
+        for message in batch:
+          if id(message) not in failed_ids:
+            self._sent += 1
+            self._delivery_latency.add(finished - message.accepted_at)
+      if failed:
+        self._retry_later(failed)
+
+  def _report(self):
+    while not self._stopping.wait(self.stats_interval):
+      stats = self.stats()
+      for name, source in self._stats_sources.items():
+        stats[name] = source()
+      logger.info("email queue stats: {}".format(json.dumps(stats)))
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""SMTP sender backed by a pool of persistent, authenticated connections.
+
+Connections are opened lazily, up to `pool_size` at once, and reused across
+batches, so the TCP, TLS and AUTH handshakes are paid once per connection
+instead of once per email. A batch is sent back to back over a single
+connection. Connections that were dropped by the server are reopened and the
+message is retried once. Messages that still fail are returned to the caller,
+and the rest of the batch is sent.
+
+For local testing, point it at an aiosmtpd stand-in:
+
+  python -m aiosmtpd -n -l localhost:8025
+  EMAIL_SENDER=smtp SMTP_HOST=localhost SMTP_PORT=8025 SMTP_SECURITY=none \
+    python email_server.py
+"""
+
+import email.message
+import queue
+import smtplib
+import ssl
+import threading
+import time
+
+from service_runtime.logger import getJSONLogger
+logger = getJSONLogger('emailservice-smtp')
+
+def _is_permanent(err):
+  """True if `err` is a 5xx reply, which sending again will not change."""
+  if isinstance(err, smtplib.SMTPRecipientsRefused):
+    return all(code >= 500 for code, _ in err.recipients.values())
+  if isinstance(err, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+    return err.smtp_code >= 500
+  return False
+
+class SMTPSender(object):
+  def __init__(self, host, port, from_address, username=None, password=None,
+               security='starttls', pool_size=2, timeout=10.0, max_idle_seconds=30.0):
+    if security not in ('starttls', 'ssl', 'none'):
+      raise Exception('unknown SMTP_SECURITY "{}", expected starttls, ssl or none'.format(security))
+    self.host = host
+    self.port = port
+    self.from_address = from_address
+    self.username = username
+    self.password = password
+    self.security = security
+    self.timeout = timeout
+    self.max_idle_seconds = max_idle_seconds
+    self._idle = queue.LifoQueue()
+    self._slots = threading.BoundedSemaphore(pool_size)
+
+  def _connect(self):
+    if self.security == 'ssl':
+      conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                              context=ssl.create_default_context())
+    else:
+      conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+      if self.security == 'starttls':
+        conn.starttls(context=ssl.create_default_context())
+    conn.ehlo_or_helo_if_needed()
+    if self.username:
+      conn.login(self.username, self.password)
+    return conn
+
+  def _acquire(self):
+    self._slots.acquire()
+    try:
+      while True:
+        try:
+          conn, idle_since = self._idle.get_nowait()
+        except queue.Empty:
+          return self._connect()
+        if time.monotonic() - idle_since < self.max_idle_seconds or self._is_alive(conn):
+          return conn
+        self._close(conn)
+    except BaseException:
+      self._slots.release()
+      raise
+
+  def _release(self, conn):
+    if conn is not None:
+      self._idle.put((conn, time.monotonic()))
+    self._slots.release()
+
+  @staticmethod
+  def _is_alive(conn):
+    try:
+      return conn.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+      return False
+
+  @staticmethod
+  def _close(conn):
+    try:
+      conn.quit()
+    except (smtplib.SMTPException, OSError):
+      conn.close()
+
+  def _build(self, message):
+    mail = email.message.EmailMessage()
+    mail['From'] = self.from_address
+    mail['To'] = message.to
+    mail['Subject'] = message.subject
+    mail.set_content(message.html_body, subtype='html')
+    return mail
+
+  def send_batch(self, messages):
+    """Sends `messages` over one pooled connection.
+
+    Returns the messages that could not be sent; each failure is logged and
+    the rest of the batch is still attempted. Messages that the server
+    refused with a permanent (5xx) reply are marked `rejected`.
+    """
+    conn = self._acquire()
+    failed = []
+    try:
+      for message in messages:
+        try:
+          mail = self._build(message)
+          if conn is None:
+            conn = self._connect()
+          try:
+            conn.send_message(mail)
+          except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # The server dropped the connection; reconnect and retry once.
+            self._close(conn)
+            conn = None
+            conn = self._connect()
+            conn.send_message(mail)
+        except Exception as err:
+          failed.append(message)
+          logger.error("Failed to send email to {}: {}".format(message.to, err))
+          if _is_permanent(err):
+            message.rejected = str(err)
+          if conn is not None:
+            self._close(conn)
+            conn = None
+    finally:
+      self._release(conn)
+    return failed
+
+  def close(self):
+    while True:
+      try:
+        conn, _ = self._idle.get_nowait()
+      except queue.Empty:
+        return
+      self._close(conn)
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+import demo_pb2
+from confirmation_renderer import ConfirmationRenderer, compile_templates, new_environment
+
+TESTDATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'testdata')
+
+def money(units, nanos, currency_code='USD'):
+  return demo_pb2.Money(currency_code=currency_code, units=units, nanos=nanos)
+
+def new_order(num_items=3):
+  order = demo_pb2.OrderResult(
+    order_id='a1b2-c3',
+    shipping_tracking_id='TRK-42',
+    shipping_cost=money(8, 990000000),
+    shipping_address=demo_pb2.Address(
+      street_address='1600 Amphitheatre Parkway', city='Mountain View', state='CA',
+      country='US', zip_code=94043))
+  for i in range(num_items):
+    order.items.add(
+      item=demo_pb2.CartItem(product_id='PROD<%d>' % i, quantity=i + 1),
+      cost=money(19 + i, 50000000 * i))
+  return order
+
+def render_loop_template(order):
+  """Renders the template used before item rows were precompiled and cached.
+
+  testdata/confirmation_loop.html is that template, with the address line
+  reading the `street_address` field that demo.proto actually defines.
+  """
+  env = Environment(loader=FileSystemLoader(TESTDATA_DIR), autoescape=select_autoescape(['html', 'xml']))
+  return env.get_template('confirmation_loop.html').render(order=order)
+
+def test_render_matches_loop_template():
+  order = new_order()
+  html = ConfirmationRenderer().render(order)
+  assert html == render_loop_template(order)
+  assert '1600 Amphitheatre Parkway, Mountain View, US 94043' in html
+  assert '#PROD&lt;0&gt;' in html
+
+def test_render_without_items_matches_loop_template():
+  order = new_order(num_items=0)
+  assert ConfirmationRenderer().render(order) == render_loop_template(order)
+
+def test_render_reuses_item_rows():
+  renderer = ConfirmationRenderer()
+  renderer.render(new_order())
+  renderer.render(new_order())
+  info = renderer.render_item_row.cache_info()
+  assert (info.misses, info.hits) == (3, 3)
+
+def test_precompiled_templates_render_the_same(tmp_path):
+  compile_templates(str(tmp_path))
+  order = new_order()
+  renderer = ConfirmationRenderer(env=new_environment(str(tmp_path)))
+  assert renderer.render(order) == render_loop_template(order)
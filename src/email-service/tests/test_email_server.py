@@ -0,0 +1,105 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import grpc
+import pytest
+from jinja2 import TemplateError
+
+import demo_pb2
+from dedup_cache import DedupCache
+from send_queue import InMemorySink, SendQueue
+
+class FakeContext(object):
+  def __init__(self):
+    self.code = None
+    self.details = None
+
+  def set_code(self, code):
+    self.code = code
+
+  def set_details(self, details):
+    self.details = details
+
+@pytest.fixture
+def email_server(service_dir):
+  # Imported after the fixture has changed into the service directory,
+  # since the module loads the templates on import.
+  import email_server
+  return email_server
+
+@pytest.fixture
+def service(email_server):
+  send_queue = SendQueue(InMemorySink(), maxsize=10, stats_interval=0)
+  return email_server.EmailService(send_queue, DedupCache(maxsize=10, ttl=60))
+
+def new_request(order_id='order-1'):
+  return demo_pb2.SendOrderConfirmationRequest(
+    email='someone@example.com', order=demo_pb2.OrderResult(order_id=order_id))
+
+def fail_once(monkeypatch, email_server, error):
+  render = email_server.renderer.render
+  calls = []
+  def flaky_render(order):
+    calls.append(order)
+    if len(calls) == 1:
+      raise error
+    return render(order)
+  monkeypatch.setattr(email_server.renderer, 'render', flaky_render)
+
+def test_duplicate_is_skipped(service):
+  service.SendOrderConfirmation(new_request(), FakeContext())
+  service.SendOrderConfirmation(new_request(), FakeContext())
+  assert service.send_queue.stats()['accepted'] == 1
+  assert service.dedup_cache.stats()['hits'] == 1
+
+def test_unexpected_error_releases_claim(monkeypatch, email_server, service):
+  fail_once(monkeypatch, email_server, AttributeError('street_address_1'))
+  with pytest.raises(AttributeError):
+    service.SendOrderConfirmation(new_request(), FakeContext())
+
+  context = FakeContext()
+  service.SendOrderConfirmation(new_request(), context)
+  assert context.code is None
+  assert service.send_queue.stats()['accepted'] == 1
+  assert service.dedup_cache.stats()['hits'] == 0
+
+def test_template_error_releases_claim(monkeypatch, email_server, service):
+  fail_once(monkeypatch, email_server, TemplateError('broken'))
+  context = FakeContext()
+  service.SendOrderConfirmation(new_request(), context)
+  assert context.code == grpc.StatusCode.INTERNAL
+
+  service.SendOrderConfirmation(new_request(), FakeContext())
+  assert service.send_queue.stats()['accepted'] == 1
+
+def test_full_queue_releases_claim(email_server):
+  send_queue = SendQueue(InMemorySink(), maxsize=1, stats_interval=0)
+  service = email_server.EmailService(send_queue, DedupCache(maxsize=10, ttl=60))
+  service.SendOrderConfirmation(new_request('order-1'), FakeContext())
+  context = FakeContext()
+  service.SendOrderConfirmation(new_request('order-2'), context)
+  assert context.code == grpc.StatusCode.RESOURCE_EXHAUSTED
+  assert service.dedup_cache.claim(('order-2', 'someone@example.com'))
+
+def test_stopping_queue_is_unavailable(email_server):
+  send_queue = SendQueue(InMemorySink(), stats_interval=0)
+  send_queue.start()
+  send_queue.stop(timeout=5)
+  service = email_server.EmailService(send_queue, DedupCache(maxsize=10, ttl=60))
+  context = FakeContext()
+  service.SendOrderConfirmation(new_request('order-1'), context)
+  assert context.code == grpc.StatusCode.UNAVAILABLE
+  assert service.dedup_cache.claim(('order-1', 'someone@example.com'))
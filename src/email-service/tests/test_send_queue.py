@@ -0,0 +1,164 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+from send_queue import EmailMessage, InMemorySink, SendQueue
+
+class BatchRecorder(InMemorySink):
+  def __init__(self):
+    super().__init__()
+    self.batch_sizes = []
+
+  def send_batch(self, messages):
+    self.batch_sizes.append(len(messages))
+    super().send_batch(messages)
+
+class FailingSink(InMemorySink):
+  """Fails each message the first `failures` times it is sent."""
+  def __init__(self, failures):
+    super().__init__()
+    self.failures = failures
+    self.calls = {}
+    self._calls_lock = threading.Lock()
+
+  def send_batch(self, messages):
+    failed = []
+    with self._calls_lock:
+      for message in messages:
+        self.calls[message.to] = self.calls.get(message.to, 0) + 1
+        if self.calls[message.to] <= self.failures:
+          failed.append(message)
+    super().send_batch([m for m in messages if m not in failed])
+    return failed
+
+def messages(count):
+  return [EmailMessage('user%d@example.com' % i, 'Your Confirmation Email', '<p>Thanks</p>')
+          for i in range(count)]
+
+def new_queue(sink, **kwargs):
+  options = dict(workers=1, batch_size=5, batch_timeout=0.05, stats_interval=0, retry_delay=0.01)
+  options.update(kwargs)
+  return SendQueue(sink, **options)
+
+def test_accepts_and_sends():
+  sink = InMemorySink()
+  send_queue = new_queue(sink)
+  send_queue.start()
+  for message in messages(7):
+    assert send_queue.submit(message)
+  send_queue.stop(timeout=5)
+  assert sorted(m.to for m in sink.messages) == sorted(m.to for m in messages(7))
+  stats = send_queue.stats()
+  assert (stats['accepted'], stats['sent'], stats['failed'], stats['depth']) == (7, 7, 0, 0)
+
+def test_drops_when_full():
+  send_queue = new_queue(InMemorySink(), maxsize=2)
+  results = [send_queue.submit(message) for message in messages(3)]
+  assert results == [True, True, False]
+  stats = send_queue.stats()
+  assert (stats['accepted'], stats['dropped'], stats['depth']) == (2, 1, 2)
+
+def test_rejects_after_stop():
+  send_queue = new_queue(InMemorySink())
+  send_queue.start()
+  send_queue.stop(timeout=5)
+  assert not send_queue.submit(messages(1)[0])
+
+def test_sends_in_batches():
+  sink = BatchRecorder()
+  send_queue = new_queue(sink)
+  for message in messages(12):
+    send_queue.submit(message)
+  send_queue.start()
+  send_queue.stop(timeout=5)
+  assert sink.batch_sizes == [5, 5, 2]
+
+def test_retries_failed_messages():
+  sink = FailingSink(failures=2)
+  send_queue = new_queue(sink, max_attempts=3)
+  send_queue.start()
+  for message in messages(3):
+    send_queue.submit(message)
+  send_queue.stop(timeout=5)
+  assert len(sink.messages) == 3
+  stats = send_queue.stats()
+  assert (stats['sent'], stats['retried'], stats['failed']) == (3, 6, 0)
+
+def test_gives_up_after_max_attempts():
+  sink = FailingSink(failures=5)
+  send_queue = new_queue(sink, max_attempts=2)
+  send_queue.start()
+  for message in messages(2):
+    send_queue.submit(message)
+  send_queue.stop(timeout=5)
+  assert sink.messages == []
+  assert sink.calls == {'user0@example.com': 2, 'user1@example.com': 2}
+  stats = send_queue.stats()
+  assert (stats['sent'], stats['retried'], stats['failed']) == (0, 2, 2)
+
+def test_gives_up_on_rejected_messages():
+  class Rejecting(InMemorySink):
+    calls = 0
+    def send_batch(self, messages):
+      self.calls += 1
+      for message in messages:
+        message.rejected = '550 no such user'
+      return messages
+
+  sink = Rejecting()
+  send_queue = new_queue(sink, max_attempts=3)
+  send_queue.start()
+  for message in messages(2):
+    send_queue.submit(message)
+  send_queue.stop(timeout=5)
+  assert sink.calls == 1
+  stats = send_queue.stats()
+  assert (stats['sent'], stats['retried'], stats['failed']) == (0, 0, 2)
+
+def test_retries_batch_when_sender_raises():
+  class Outage(InMemorySink):
+    calls = 0
+    def send_batch(self, messages):
+      self.calls += 1
+      if self.calls == 1:
+        raise ConnectionError('provider unavailable')
+      super().send_batch(messages)
+
+  sink = Outage()
+  send_queue = new_queue(sink)
+  send_queue.start()
+  for message in messages(3):
+    send_queue.submit(message)
+  send_queue.stop(timeout=5)
+  assert len(sink.messages) == 3
+  assert send_queue.stats()['failed'] == 0
+
+def test_stop_timeout_is_one_deadline_for_all_threads():
+  release = threading.Event()
+  class BlockedSink(InMemorySink):
+    def send_batch(self, messages):
+      release.wait(5)
+
+  send_queue = new_queue(BlockedSink(), workers=3, batch_size=1)
+  send_queue.start()
+  for message in messages(3):
+    send_queue.submit(message)
+  started = time.monotonic()
+  send_queue.stop(timeout=0.5)
+  assert time.monotonic() - started < 1.0
+  release.set()
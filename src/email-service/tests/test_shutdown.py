@@ -0,0 +1,67 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import grpc
+from grpc_health.v1 import health_pb2, health_pb2_grpc
+
+import demo_pb2
+import demo_pb2_grpc
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+def wait_until_serving(channel, timeout=15):
+  deadline = time.monotonic() + timeout
+  while True:
+    try:
+      health_pb2_grpc.HealthStub(channel).Check(health_pb2.HealthCheckRequest(), timeout=1)
+      return
+    except grpc.RpcError:
+      if time.monotonic() > deadline:
+        raise
+      time.sleep(0.1)
+
+def test_sigterm_drains_queue(service_dir, tmp_path):
+  port = free_port()
+  sink_file = tmp_path / 'sent.jsonl'
+  env = dict(os.environ, PORT=str(port), EMAIL_SENDER='file', EMAIL_SINK_FILE=str(sink_file),
+             # A lone message waits this long for its batch to fill, so it is
+             # still queued when the server is told to stop.
+             EMAIL_BATCH_TIMEOUT_SECONDS='2', METRICS_PORT='0', DISABLE_PROFILER='1')
+  server = subprocess.Popen([sys.executable, 'email_server.py'], cwd=service_dir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  try:
+    with grpc.insecure_channel('127.0.0.1:%d' % port) as channel:
+      wait_until_serving(channel)
+      demo_pb2_grpc.EmailServiceStub(channel).SendOrderConfirmation(
+        demo_pb2.SendOrderConfirmationRequest(
+          email='someone@example.com', order=demo_pb2.OrderResult(order_id='order-1')))
+    server.send_signal(signal.SIGTERM)
+    assert server.wait(timeout=10) == 0
+  finally:
+    server.kill()
+  sent = [json.loads(line) for line in sink_file.read_text().splitlines()]
+  assert [message['to'] for message in sent] == ['someone@example.com']
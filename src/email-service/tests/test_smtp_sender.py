@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from send_queue import EmailMessage, SendQueue
+from smtp_sender import SMTPSender
+
+REFUSED = 'refused@example.com'
+BUSY = 'busy@example.com'
+
+class Handler(object):
+  """Collects delivered messages, refuses one recipient and defers another."""
+  def __init__(self):
+    self.recipients = []
+
+  async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+    if address == REFUSED:
+      return '550 no such user'
+    if address == BUSY:
+      return '450 mailbox busy'
+    envelope.rcpt_tos.append(address)
+    return '250 OK'
+
+  async def handle_DATA(self, server, session, envelope):
+    self.recipients.extend(envelope.rcpt_tos)
+    return '250 Message accepted for delivery'
+
+def free_port():
+  with socket.socket() as sock:
+    sock.bind(('127.0.0.1', 0))
+    return sock.getsockname()[1]
+
+class SMTPServer(object):
+  """aiosmtpd server on a fixed port that can be restarted."""
+  def __init__(self):
+    self.port = free_port()
+    self.handler = Handler()
+    self.controller = None
+
+  def start(self):
+    self.controller = Controller(self.handler, hostname='127.0.0.1', port=self.port)
+    self.controller.start()
+
+  def stop(self):
+    if self.controller is not None:
+      self.controller.stop()
+      self.controller = None
+
+@pytest.fixture
+def smtp_server():
+  server = SMTPServer()
+  server.start()
+  yield server
+  server.stop()
+
+@pytest.fixture
+def sender(smtp_server):
+  sender = SMTPSender('127.0.0.1', smtp_server.port, 'shop@example.com', security='none',
+                      pool_size=1, timeout=5)
+  yield sender
+  sender.close()
+
+def messages(*recipients):
+  return [EmailMessage(to, 'Your Confirmation Email', '<p>Thanks</p>') for to in recipients]
+
+def test_sends_batch_over_one_connection(smtp_server, sender):
+  assert sender.send_batch(messages('a@example.com', 'b@example.com')) == []
+  assert sender.send_batch(messages('c@example.com')) == []
+  assert smtp_server.handler.recipients == ['a@example.com', 'b@example.com', 'c@example.com']
+  assert sender._idle.qsize() == 1
+
+def test_refused_recipient_does_not_stop_batch(smtp_server, sender):
+  batch = messages('a@example.com', REFUSED, 'b@example.com')
+  assert sender.send_batch(batch) == [batch[1]]
+  assert smtp_server.handler.recipients == ['a@example.com', 'b@example.com']
+  assert batch[1].rejected is not None
+
+def test_temporary_refusal_is_not_rejected(smtp_server, sender):
+  batch = messages(BUSY, 'a@example.com')
+  assert sender.send_batch(batch) == [batch[0]]
+  assert batch[0].rejected is None
+
+def test_reconnects_after_server_restart(smtp_server, sender):
+  assert sender.send_batch(messages('a@example.com')) == []
+  smtp_server.stop()
+  smtp_server.start()
+  assert sender.send_batch(messages('b@example.com', 'c@example.com')) == []
+  assert smtp_server.handler.recipients == ['a@example.com', 'b@example.com', 'c@example.com']
+
+def test_server_down_fails_each_message(smtp_server, sender):
+  assert sender.send_batch(messages('a@example.com')) == []
+  smtp_server.stop()
+  batch = messages('b@example.com', 'c@example.com')
+  assert sender.send_batch(batch) == batch
+
+  smtp_server.start()
+  assert sender.send_batch(messages('d@example.com')) == []
+  assert smtp_server.handler.recipients == ['a@example.com', 'd@example.com']
+
+def test_queue_counts_partial_failures(smtp_server, sender):
+  send_queue = SendQueue(sender, workers=1, batch_size=10, batch_timeout=0.2, stats_interval=0,
+                         max_attempts=3, retry_delay=0.01)
+  send_queue.start()
+  for message in messages('a@example.com', REFUSED, BUSY, 'b@example.com'):
+    assert send_queue.submit(message)
+  send_queue.stop(timeout=5)
+  stats = send_queue.stats()
+  # The refused recipient fails at once, the busy one after three attempts.
+  assert (stats['sent'], stats['retried'], stats['failed']) == (2, 2, 2)
@@ -14,13 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# [START gke_recommendationservice_genproto]
+# [START gke_pythonruntime_genproto]
 
 # script to compile python protos
 #
 # requires gRPC tools:
-#   pip install -r requirements.txt
+#   pip install grpcio-tools
 
 python -m grpc_tools.protoc -I../../protos --python_out=. --grpc_python_out=. ../../protos/demo.proto
 
-# [END gke_recommendationservice_genproto]
\ No newline at end of file
+# [END gke_pythonruntime_genproto]
\ No newline at end of file
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares records per second of CustomJsonFormatter and FastJsonFormatter.
+
+  python logger_benchmark.py [records]
+"""
+
+import logging
+import sys
+import time
+
+from service_runtime import logger
+
+FORMAT = '%(timestamp)s %(severity)s %(name)s %(message)s'
+
+def make_records(count):
+  records = []
+  for i in range(count):
+    record = logging.LogRecord(
+      'recommendationservice', logging.INFO, __file__, i,
+      '[Recv ListRecommendations] product_ids=%s',
+      (['OLJCESPC7Z', '66VCHSJNUP', '1YMWWN1N4O', 'L9ECAV7KIM', '2ZYFJ3GM2N'],), None)
+    if i % 10 == 0:
+      record.suppressed = i
+    records.append(record)
+  return records
+
+def run(formatter, records, rounds=5):
+  best = None
+  for _ in range(rounds):
+    start = time.perf_counter()
+    for record in records:
+      formatter.format(record)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+  return len(records) / best
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+  records = make_records(count)
+  baseline = run(logger.CustomJsonFormatter(FORMAT), records)
+  fast = run(logger.FastJsonFormatter(FORMAT), records)
+  print('serializer:          {}'.format('orjson' if logger.orjson is not None else 'json'))
+  print('CustomJsonFormatter: {:>10,.0f} records/s'.format(baseline))
+  print('FastJsonFormatter:   {:>10,.0f} records/s ({:.1f}x)'.format(fast, fast / baseline))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,25 @@
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runtime shared by the Python gRPC services.
+
+  channels        gRPC client channels configured from the environment
+  health          grpc.health.v1 Check/Watch handlers
+  logger          JSON logging to stdout
+  metrics         Prometheus metrics of gRPC servers
+  prefork         pre-fork serving over SO_REUSEPORT
+  profiling       Cloud Profiler or local sampling profiler startup
+  server_config   gRPC servers configured from the environment
+  tracing         OpenTelemetry instrumentation and OTLP export
+"""
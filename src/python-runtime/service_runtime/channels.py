@@ -0,0 +1,62 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""gRPC client channels configured from the environment.
+
+  GRPC_CLIENT_KEEPALIVE_TIME_MS     interval of client keepalive pings
+  GRPC_CLIENT_KEEPALIVE_TIMEOUT_MS  time to wait for a keepalive ack
+  GRPC_LB_POLICY                    load balancing policy, e.g. round_robin
+                                    to spread calls over all addresses of a
+                                    headless service (pick_first)
+  GRPC_MAX_MESSAGE_LENGTH           max send/receive message size in bytes,
+                                    shared with server_config
+
+Unset variables keep the gRPC defaults.
+"""
+
+import os
+
+import grpc
+
+from .server_config import _env_int
+
+def channel_options():
+  options = []
+  keepalive_time = _env_int('GRPC_CLIENT_KEEPALIVE_TIME_MS')
+  if keepalive_time is not None:
+    options.append(('grpc.keepalive_time_ms', keepalive_time))
+  keepalive_timeout = _env_int('GRPC_CLIENT_KEEPALIVE_TIMEOUT_MS')
+  if keepalive_timeout is not None:
+    options.append(('grpc.keepalive_timeout_ms', keepalive_timeout))
+  lb_policy = os.environ.get('GRPC_LB_POLICY', '')
+  if lb_policy:
+    options.append(('grpc.lb_policy_name', lb_policy))
+  max_message_length = _env_int('GRPC_MAX_MESSAGE_LENGTH')
+  if max_message_length is not None:
+    options.append(('grpc.max_send_message_length', max_message_length))
+    options.append(('grpc.max_receive_message_length', max_message_length))
+  return options
+
+def new_channel(target, interceptors=None):
+  """Creates an insecure grpc channel to `target` configured from the environment."""
+  channel = grpc.insecure_channel(target, options=channel_options())
+  if interceptors:
+    channel = grpc.intercept_channel(channel, *interceptors)
+  return channel
+
+def new_aio_channel(target, interceptors=None):
+  """Creates an insecure grpc.aio channel to `target` configured from the environment."""
+  return grpc.aio.insecure_channel(target, options=channel_options(), interceptors=interceptors)
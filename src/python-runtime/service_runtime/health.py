@@ -0,0 +1,50 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""grpc.health.v1 handlers that report the service as SERVING.
+
+Mix one of these into a servicer and register the servicer itself with
+add_health_servicer, as the services did with their own Check/Watch.
+"""
+
+from grpc_health.v1 import health_pb2
+from grpc_health.v1 import health_pb2_grpc
+
+def serving():
+  return health_pb2.HealthCheckResponse(
+    status=health_pb2.HealthCheckResponse.SERVING)
+
+def unimplemented():
+  return health_pb2.HealthCheckResponse(
+    status=health_pb2.HealthCheckResponse.UNIMPLEMENTED)
+
+class HealthCheckMixin(object):
+  def Check(self, request, context):
+    return serving()
+
+  def Watch(self, request, context):
+    return unimplemented()
+
+class AsyncHealthCheckMixin(object):
+  """HealthCheckMixin for servicers registered with a grpc.aio server."""
+  async def Check(self, request, context):
+    return serving()
+
+  async def Watch(self, request, context):
+    return unimplemented()
+
+def add_health_servicer(servicer, server):
+  health_pb2_grpc.add_HealthServicer_to_server(servicer, server)
@@ -0,0 +1,281 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from pythonjsonlogger import jsonlogger
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+class CustomJsonFormatter(jsonlogger.JsonFormatter):
+  def add_fields(self, log_record, record, message_dict):
+    super(CustomJsonFormatter, self).add_fields(log_record, record, message_dict)
+    if not log_record.get('timestamp'):
+      log_record['timestamp'] = record.created
+    if log_record.get('severity'):
+      log_record['severity'] = log_record['severity'].upper()
+    else:
+      log_record['severity'] = record.levelname
+
+_FIELD_PATTERN = re.compile(r'%\((\w+)\)')
+_RECORD_ATTRIBUTES = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+_RECORD_ATTRIBUTE_COUNT = len(logging.makeLogRecord({}).__dict__)
+_json_encoder = json.JSONEncoder(default=str)
+
+def _dumps(log_record):
+  if orjson is not None:
+    return orjson.dumps(log_record, default=str).decode('utf-8')
+  return _json_encoder.encode(log_record)
+
+class FastJsonFormatter(logging.Formatter):
+  """Produces the same JSON lines as CustomJsonFormatter, with less work per record.
+
+  The fields named in the format string are turned into getter functions
+  once, extra attributes are only looked for when the record has more
+  attributes than a plain LogRecord, and the result is serialized with
+  orjson when it is installed.
+  """
+  def __init__(self, fmt):
+    super(FastJsonFormatter, self).__init__(fmt)
+    self._getters = tuple((field, self._getter(field)) for field in _FIELD_PATTERN.findall(fmt))
+
+  def _getter(self, field):
+    if field == 'timestamp':
+      return lambda record: record.__dict__.get('timestamp') or record.created
+    if field == 'severity':
+      return lambda record: (record.__dict__.get('severity') or record.levelname).upper()
+    if field == 'message':
+      return lambda record: '' if isinstance(record.msg, dict) else record.getMessage()
+    if field == 'asctime':
+      return lambda record: self.formatTime(record, self.datefmt)
+    return lambda record: record.__dict__.get(field)
+
+  def format(self, record):
+    log_record = {field: getter(record) for field, getter in self._getters}
+    if isinstance(record.msg, dict):
+      log_record.update(record.msg)
+    if record.exc_info and not log_record.get('exc_info'):
+      log_record['exc_info'] = self.formatException(record.exc_info)
+    elif record.exc_text and not log_record.get('exc_info'):
+      log_record['exc_info'] = record.exc_text
+    if record.stack_info and not log_record.get('stack_info'):
+      log_record['stack_info'] = self.formatStack(record.stack_info)
+    attributes = record.__dict__
+    if len(attributes) > _RECORD_ATTRIBUTE_COUNT:
+      for key, value in attributes.items():
+        if key not in _RECORD_ATTRIBUTES and key not in log_record:
+          log_record[key] = value
+    return _dumps(log_record)
+
+def newJSONFormatter():
+  fmt = '%(timestamp)s %(severity)s %(name)s %(message)s'
+  if os.environ.get('LOG_FORMATTER', 'json') == 'fast':
+    return FastJsonFormatter(fmt)
+  return CustomJsonFormatter(fmt)
+
+class _BatchWriter(logging.StreamHandler):
+  """Listener-side handler that writes formatted records in batches.
+
+  Lines are buffered and written with a single write() and flush() once
+  `batch_size` lines are pending or the queue has been drained.
+  """
+  def __init__(self, stream, source, batch_size):
+    super(_BatchWriter, self).__init__(stream)
+    self.source = source
+    self.batch_size = batch_size
+    self._buffer = []
+    self._reported_drops = 0
+
+  def emit(self, record):
+    try:
+      self._buffer.append(self.format(record))
+    except Exception:
+      self.handleError(record)
+    if len(self._buffer) >= self.batch_size or self.source.queue.empty():
+      self.flush()
+
+  def flush(self):
+    self.acquire()
+    try:
+      dropped = self.source.dropped
+      if dropped > self._reported_drops:
+        self._buffer.append(self.format(logging.makeLogRecord({
+          'name': 'logger', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+          'msg': '%d log records dropped because the log queue was full',
+          'args': (dropped - self._reported_drops,)})))
+        self._reported_drops = dropped
+      if self._buffer and self.stream:
+        self.stream.write(self.terminator.join(self._buffer) + self.terminator)
+        self.stream.flush()
+      self._buffer = []
+    finally:
+      self.release()
+
+class _Listener(logging.handlers.QueueListener):
+  def enqueue_sentinel(self):
+    # Wait for room so that stop() never gives up on pending records.
+    self.queue.put(self._sentinel)
+
+class AsyncJSONHandler(logging.handlers.QueueHandler):
+  """QueueHandler whose records are formatted and written by a background thread.
+
+  The calling thread only merges the message arguments and enqueues the
+  record. When the bounded queue is full, `overflow` decides what happens:
+  'drop' discards the record (the number dropped is logged later), 'block'
+  waits for room.
+  """
+  def __init__(self, stream, formatter, maxsize=10000, overflow='drop', batch_size=100):
+    if overflow not in ('drop', 'block'):
+      raise Exception('unknown LOG_QUEUE_OVERFLOW "{}", expected drop or block'.format(overflow))
+    super(AsyncJSONHandler, self).__init__(queue.Queue(maxsize))
+    self.overflow = overflow
+    self.dropped = 0
+    self._dropped_lock = threading.Lock()
+    writer = _BatchWriter(stream, self, batch_size)
+    writer.setFormatter(formatter)
+    self.listener = _Listener(self.queue, writer)
+
+  def enqueue(self, record):
+    if self.overflow == 'block':
+      self.queue.put(record)
+      return
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      # Any thread can log, so the increment must not race.
+      with self._dropped_lock:
+        self.dropped += 1
+
+  def prepare(self, record):
+    # Resolve the message while its arguments are still valid, but leave the
+    # JSON formatting to the listener thread.
+    record = copy.copy(record)
+    if not isinstance(record.msg, dict):
+      record.msg = record.getMessage()
+      record.args = None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    return record
+
+  def start(self):
+    self.listener.start()
+    atexit.register(self.stop)
+
+  def stop(self):
+    # Also runs at exit, possibly after an explicit stop().
+    if self.listener._thread is not None:
+      self.listener.stop()
+
+class RateLimitFilter(logging.Filter):
+  """Samples and rate-limits records below WARNING, per message template.
+
+  A record is first kept with probability `sample_rate`, then charged to a
+  token bucket keyed by its unformatted message (the `%`-style template),
+  which refills at `rate` records per second up to `burst`. A `rate` of 0
+  disables the limit. The first record let through after others were
+  suppressed carries their count in a `suppressed` field.
+
+  Filters run before any handler formats the record, so with `%`-style
+  arguments suppressed records never build their message string.
+  """
+  def __init__(self, sample_rate=1.0, rate=0.0, burst=None, max_templates=1024,
+               clock=time.monotonic, rng=random.random):
+    super(RateLimitFilter, self).__init__()
+    self.sample_rate = sample_rate
+    self.rate = rate
+    self.burst = burst if burst is not None else max(1.0, rate)
+    self.max_templates = max_templates
+    self._clock = clock
+    self._rng = rng
+    self._buckets = {}
+    self._lock = threading.Lock()
+
+  def filter(self, record):
+    if record.levelno >= logging.WARNING:
+      return True
+    if self.sample_rate < 1.0 and self._rng() >= self.sample_rate:
+      return False
+    if self.rate <= 0:
+      return True
+    key = record.msg if isinstance(record.msg, str) else type(record.msg)
+    now = self._clock()
+    with self._lock:
+      bucket = self._buckets.get(key)
+      if bucket is None:
+        if len(self._buckets) >= self.max_templates:
+          self._buckets.clear()
+        bucket = self._buckets[key] = [self.burst, now, 0]
+      tokens, updated, suppressed = bucket
+      tokens = min(self.burst, tokens + (now - updated) * self.rate)
+      if tokens < 1.0:
+        bucket[:] = [tokens, now, suppressed + 1]
+        return False
+      bucket[:] = [tokens - 1.0, now, 0]
+    if suppressed:
+      record.suppressed = suppressed
+    return True
+
+def _newRateLimitFilter():
+  sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+  rate = float(os.environ.get('LOG_RATE_LIMIT', '0'))
+  if sample_rate >= 1.0 and rate <= 0:
+    return None
+  burst = os.environ.get('LOG_RATE_BURST')
+  return RateLimitFilter(sample_rate, rate, float(burst) if burst else None)
+
+_async_handler = None
+
+def _getAsyncHandler(formatter):
+  # One queue and listener thread per process, shared by all loggers.
+  global _async_handler
+  if _async_handler is None:
+    _async_handler = AsyncJSONHandler(
+      sys.stdout, formatter,
+      maxsize=int(os.environ.get('LOG_QUEUE_SIZE', '10000')),
+      overflow=os.environ.get('LOG_QUEUE_OVERFLOW', 'drop'),
+      batch_size=int(os.environ.get('LOG_BATCH_SIZE', '100')))
+    _async_handler.start()
+  return _async_handler
+
+def getJSONLogger(name):
+  logger = logging.getLogger(name)
+  formatter = newJSONFormatter()
+  if os.environ.get('LOG_HANDLER', 'stream') == 'queue':
+    handler = _getAsyncHandler(formatter)
+  else:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(formatter)
+  logger.addHandler(handler)
+  rate_limit = _newRateLimitFilter()
+  if rate_limit is not None:
+    logger.addFilter(rate_limit)
+  logger.setLevel(logging.INFO)
+  logger.propagate = False
+  return logger
@@ -0,0 +1,273 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prometheus metrics for gRPC servers.
+
+  METRICS_PORT   port of the HTTP endpoint serving the metrics; 0 turns
+                 metrics off (9464)
+
+ServerInterceptor and AsyncServerInterceptor record, per method, a latency
+histogram, an in-flight gauge and a counter of status codes.
+InstrumentedExecutor reports how many RPCs of a thread pool server are
+waiting for a worker thread.
+
+With pre-fork serving, workers write their metrics to files in
+PROMETHEUS_MULTIPROC_DIR and the supervisor serves their sum, see
+init_multiprocess().
+"""
+
+import asyncio
+import atexit
+import glob
+import inspect
+import os
+import shutil
+import tempfile
+import time
+from concurrent import futures
+
+import grpc
+import prometheus_client
+from prometheus_client import multiprocess
+
+from .logger import getJSONLogger
+logger = getJSONLogger('service-runtime-metrics')
+
+MULTIPROC_DIR_ENV = 'PROMETHEUS_MULTIPROC_DIR'
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+RPC_LATENCY = prometheus_client.Histogram(
+  'grpc_server_handling_seconds', 'Time spent handling RPCs.',
+  ['grpc_service', 'grpc_method'], buckets=LATENCY_BUCKETS)
+RPC_HANDLED = prometheus_client.Counter(
+  'grpc_server_handled_total', 'RPCs completed, by status code.',
+  ['grpc_service', 'grpc_method', 'grpc_code'])
+RPC_IN_FLIGHT = prometheus_client.Gauge(
+  'grpc_server_in_flight', 'RPCs being handled.',
+  ['grpc_service', 'grpc_method'], multiprocess_mode='livesum')
+EXECUTOR_QUEUE_DEPTH = prometheus_client.Gauge(
+  'grpc_server_executor_queue_depth', 'RPCs waiting for a thread of the server executor.',
+  multiprocess_mode='livesum')
+
+def port():
+  return int(os.environ.get('METRICS_PORT', '9464'))
+
+def enabled():
+  return port() != 0
+
+class _MethodMetrics(object):
+  """Metrics of one method, with the label lookups done once."""
+  def __init__(self, full_method):
+    # full_method is "/package.Service/Method"
+    self.service, _, self.method = full_method.lstrip('/').rpartition('/')
+    self.latency = RPC_LATENCY.labels(self.service, self.method)
+    self.in_flight = RPC_IN_FLIGHT.labels(self.service, self.method)
+    self._handled = {}
+
+  def start(self):
+    self.in_flight.inc()
+    return time.perf_counter()
+
+  def done(self, started, code):
+    self.latency.observe(time.perf_counter() - started)
+    self.in_flight.dec()
+    counter = self._handled.get(code)
+    if counter is None:
+      counter = self._handled[code] = RPC_HANDLED.labels(self.service, self.method, code.name)
+    counter.inc()
+
+_methods = {}
+
+def _method_metrics(full_method):
+  metrics = _methods.get(full_method)
+  if metrics is None:
+    metrics = _methods[full_method] = _MethodMetrics(full_method)
+  return metrics
+
+def _ok_code(context):
+  return context.code() or grpc.StatusCode.OK
+
+def _error_code(context, error):
+  if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+    return grpc.StatusCode.CANCELLED
+  # context.abort() sets the code before raising
+  return context.code() or grpc.StatusCode.UNKNOWN
+
+def _unary_response(behavior, metrics):
+  def handler(request, context):
+    started = metrics.start()
+    try:
+      response = behavior(request, context)
+    except BaseException as error:
+      metrics.done(started, _error_code(context, error))
+      raise
+    metrics.done(started, _ok_code(context))
+    return response
+  return handler
+
+def _stream_response(behavior, metrics):
+  def handler(request, context):
+    started = metrics.start()
+    try:
+      for response in behavior(request, context):
+        yield response
+    except BaseException as error:
+      metrics.done(started, _error_code(context, error))
+      raise
+    metrics.done(started, _ok_code(context))
+  return handler
+
+def _async_unary_response(behavior, metrics):
+  async def handler(request, context):
+    started = metrics.start()
+    try:
+      response = await behavior(request, context)
+    except BaseException as error:
+      metrics.done(started, _error_code(context, error))
+      raise
+    metrics.done(started, _ok_code(context))
+    return response
+  return handler
+
+def _async_stream_response(behavior, metrics):
+  # grpc.aio streaming handlers are either async generators or coroutines
+  # that write the responses with context.write().
+  if not inspect.isasyncgenfunction(behavior):
+    return _async_unary_response(behavior, metrics)
+  async def handler(request, context):
+    started = metrics.start()
+    try:
+      async for response in behavior(request, context):
+        yield response
+    except BaseException as error:
+      metrics.done(started, _error_code(context, error))
+      raise
+    metrics.done(started, _ok_code(context))
+  return handler
+
+def _instrument(handler, full_method, unary_response, stream_response):
+  if handler is None:
+    return None
+  metrics = _method_metrics(full_method)
+  if handler.unary_unary:
+    return grpc.unary_unary_rpc_method_handler(
+      unary_response(handler.unary_unary, metrics),
+      handler.request_deserializer, handler.response_serializer)
+  if handler.unary_stream:
+    return grpc.unary_stream_rpc_method_handler(
+      stream_response(handler.unary_stream, metrics),
+      handler.request_deserializer, handler.response_serializer)
+  if handler.stream_unary:
+    return grpc.stream_unary_rpc_method_handler(
+      unary_response(handler.stream_unary, metrics),
+      handler.request_deserializer, handler.response_serializer)
+  return grpc.stream_stream_rpc_method_handler(
+    stream_response(handler.stream_stream, metrics),
+    handler.request_deserializer, handler.response_serializer)
+
+class ServerInterceptor(grpc.ServerInterceptor):
+  """Records RPC metrics of a thread pool grpc.server."""
+  def intercept_service(self, continuation, handler_call_details):
+    return _instrument(continuation(handler_call_details), handler_call_details.method,
+                       _unary_response, _stream_response)
+
+class AsyncServerInterceptor(grpc.aio.ServerInterceptor):
+  """Records RPC metrics of a grpc.aio server."""
+  async def intercept_service(self, continuation, handler_call_details):
+    return _instrument(await continuation(handler_call_details), handler_call_details.method,
+                       _async_unary_response, _async_stream_response)
+
+class InstrumentedExecutor(futures.ThreadPoolExecutor):
+  """ThreadPoolExecutor that reports its queue length as grpc_server_executor_queue_depth.
+
+  A steadily non-zero queue means RPCs wait for a thread, i.e.
+  GRPC_MAX_WORKERS (or SERVER_PROCESSES) is too low for the load.
+  """
+  def submit(self, fn, *args, **kwargs):
+    EXECUTOR_QUEUE_DEPTH.inc()
+    def run():
+      EXECUTOR_QUEUE_DEPTH.dec()
+      return fn(*args, **kwargs)
+    try:
+      return super().submit(run)
+    except BaseException:
+      EXECUTOR_QUEUE_DEPTH.dec()
+      raise
+
+def server_interceptors():
+  """Interceptors for server_config.new_server(); none when metrics are off."""
+  return [ServerInterceptor()] if enabled() else []
+
+def aio_server_interceptors():
+  """Interceptors for server_config.new_aio_server(); none when metrics are off."""
+  return [AsyncServerInterceptor()] if enabled() else []
+
+def new_executor(max_workers):
+  """Thread pool for server_config.new_server(), instrumented unless metrics are off."""
+  if enabled():
+    return InstrumentedExecutor(max_workers=max_workers)
+  return futures.ThreadPoolExecutor(max_workers=max_workers)
+
+def _serve(registry):
+  prometheus_client.start_http_server(port(), registry=registry)
+  logger.info("serving metrics on port %d", port())
+
+def init_metrics():
+  """Serves this process's metrics on METRICS_PORT.
+
+  Does nothing in pre-fork workers, whose metrics are served by the
+  supervisor (see init_multiprocess()).
+  """
+  if not enabled():
+    logger.info("Metrics disabled.")
+    return
+  if 'SERVER_WORKER_INDEX' in os.environ:
+    return
+  registry = prometheus_client.REGISTRY
+  if os.environ.get(MULTIPROC_DIR_ENV):
+    registry = prometheus_client.CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+  _serve(registry)
+
+def init_multiprocess():
+  """Prepares metrics of pre-fork workers and serves their sum.
+
+  Called by the supervisor before it starts the workers. Workers inherit
+  PROMETHEUS_MULTIPROC_DIR (a temporary directory unless it is already
+  set) and write their metrics there instead of keeping them in memory.
+  Returns a function to call with the pid of each worker that exits, or
+  None when metrics are off.
+  """
+  if not enabled():
+    return None
+  directory = os.environ.get(MULTIPROC_DIR_ENV)
+  if directory:
+    # Files left by an earlier run would be added to this run's metrics.
+    for path in glob.glob(os.path.join(directory, '*.db')):
+      os.remove(path)
+  else:
+    directory = tempfile.mkdtemp(prefix='prometheus-')
+    os.environ[MULTIPROC_DIR_ENV] = directory
+    atexit.register(shutil.rmtree, directory, True)
+  registry = prometheus_client.CollectorRegistry()
+  multiprocess.MultiProcessCollector(registry, path=directory)
+  _serve(registry)
+
+  def worker_exited(pid):
+    # Drops the in-flight and queue gauges of the dead worker.
+    multiprocess.mark_process_dead(pid, directory)
+  return worker_exited
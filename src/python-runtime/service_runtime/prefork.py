@@ -0,0 +1,142 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pre-fork serving: N worker processes share the gRPC port via SO_REUSEPORT.
+
+The supervisor process never creates gRPC objects itself. Workers are
+started with the "spawn" method, so each one builds its own server,
+channels and caches from scratch, which is what gRPC requires after a
+fork. Dead workers are restarted and SIGTERM/SIGINT are forwarded to the
+workers, which get `SERVER_SHUTDOWN_GRACE_SECONDS` to exit before they
+are killed. The supervisor serves the workers' combined metrics, see
+metrics.init_multiprocess().
+"""
+
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+
+from . import metrics
+from .logger import getJSONLogger
+logger = getJSONLogger('prefork-supervisor')
+
+# Workers that die sooner than this after being started are restarted with
+# a delay, so a crash loop does not burn a core.
+MIN_WORKER_UPTIME_SECONDS = 5.0
+
+def processes():
+  return int(os.environ.get('SERVER_PROCESSES', '1'))
+
+def shutdown_grace():
+  """Seconds a stopping server gets before it is killed."""
+  return float(os.environ.get('SERVER_SHUTDOWN_GRACE_SECONDS', '10'))
+
+def _interrupt_on_signals():
+  # Let the server's KeyboardInterrupt handler do the graceful shutdown.
+  # Later signals are ignored, so that they cannot cut the shutdown short;
+  # the supervisor or the container runtime kills the process if it takes
+  # too long.
+  def interrupt(signum, frame):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    raise KeyboardInterrupt()
+  signal.signal(signal.SIGTERM, interrupt)
+  signal.signal(signal.SIGINT, interrupt)
+
+def _worker_main(target, index):
+  _interrupt_on_signals()
+  os.environ['SERVER_WORKER_INDEX'] = str(index)
+  target()
+
+def run(target, num_processes):
+  """Runs `target` in `num_processes` worker processes and supervises them.
+
+  `target` must be a module level function that creates and runs a server
+  and returns when the server stops. With a single process it is called
+  directly in the current process. Either way SIGTERM and SIGINT raise
+  KeyboardInterrupt in the process running `target`.
+  """
+  if num_processes <= 1:
+    _interrupt_on_signals()
+    target()
+    return
+
+  # Every worker binds the same port; the kernel balances connections.
+  os.environ['GRPC_SO_REUSEPORT'] = '1'
+  grace = shutdown_grace()
+  ctx = multiprocessing.get_context('spawn')
+  workers = {}
+  started_at = {}
+  stopping = []
+  # Written to by the signal handler, to wake up the wait for dead workers
+  # even if no worker exits.
+  wakeup_r, wakeup_w = os.pipe()
+
+  def start_worker(index):
+    process = ctx.Process(target=_worker_main, args=(target, index), name='worker-%d' % index)
+    process.start()
+    workers[index] = process
+    started_at[index] = time.monotonic()
+    logger.info("started worker {} (pid {})".format(index, process.pid))
+
+  def stop(signum, frame):
+    if not stopping:
+      logger.info("received signal {}, stopping {} workers".format(signum, len(workers)))
+    stopping.append(signum)
+    os.write(wakeup_w, b'\0')
+    for process in workers.values():
+      if process.is_alive():
+        os.kill(process.pid, signal.SIGTERM)
+
+  signal.signal(signal.SIGTERM, stop)
+  signal.signal(signal.SIGINT, stop)
+
+  # Before the workers start, so that they inherit PROMETHEUS_MULTIPROC_DIR.
+  worker_exited = metrics.init_multiprocess()
+
+  for index in range(num_processes):
+    start_worker(index)
+
+  while not stopping:
+    sentinels = {p.sentinel: index for index, p in workers.items()}
+    ready = multiprocessing.connection.wait(list(sentinels) + [wakeup_r])
+    for sentinel in ready:
+      if stopping:
+        break
+      index = sentinels[sentinel]
+      process = workers[index]
+      process.join()
+      logger.warning("worker {} (pid {}) exited with code {}, restarting".format(
+        index, process.pid, process.exitcode))
+      if worker_exited is not None:
+        worker_exited(process.pid)
+      uptime = time.monotonic() - started_at[index]
+      if uptime < MIN_WORKER_UPTIME_SECONDS:
+        time.sleep(MIN_WORKER_UPTIME_SECONDS - uptime)
+      if not stopping:
+        start_worker(index)
+
+  deadline = time.monotonic() + grace
+  for process in workers.values():
+    process.join(max(0, deadline - time.monotonic()))
+    if process.is_alive():
+      logger.warning("worker pid {} did not stop in {}s, killing it".format(process.pid, grace))
+      process.kill()
+      process.join()
+  os.close(wakeup_r)
+  os.close(wakeup_w)
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Profiler startup.
+
+  DISABLE_PROFILER                  set to any value to skip the profiler
+  PROFILER_BACKEND                  cloud (Cloud Profiler) or local (cloud)
+  GCP_PROJECT_ID                    project to report to (detected when unset)
+  PROFILER_OUTPUT_DIR               where the local backend writes profiles
+                                    (/tmp/profiles)
+  PROFILER_SAMPLE_INTERVAL_SECONDS  local sampling interval (0.01)
+  PROFILER_DUMP_INTERVAL_SECONDS    local profile length (60)
+
+Both backends start in a background thread, so the caller is never delayed.
+"""
+
+import atexit
+import collections
+import os
+import sys
+import threading
+import time
+
+import googlecloudprofiler
+
+from .logger import getJSONLogger
+logger = getJSONLogger('service-runtime-profiling')
+
+def initStackdriverProfiling(service, service_version='1.0.0', attempts=5,
+                             initial_backoff=1.0, max_backoff=60.0):
+  """Starts the Cloud Profiler agent, retrying with exponential backoff.
+
+  Blocks until the agent has started or `attempts` have failed; call it
+  from a background thread. Wall time profiling needs the main thread
+  (and only covers the main thread), so it is turned off.
+  """
+  project_id = os.environ.get("GCP_PROJECT_ID")
+  delay = initial_backoff
+  for attempt in range(1, attempts + 1):
+    try:
+      if project_id:
+        googlecloudprofiler.start(service=service, service_version=service_version, verbose=0,
+                                  project_id=project_id, disable_wall_profiling=True)
+      else:
+        googlecloudprofiler.start(service=service, service_version=service_version, verbose=0,
+                                  disable_wall_profiling=True)
+      logger.info("Successfully started Stackdriver Profiler.")
+      return True
+    except (BaseException) as exc:
+      logger.info("Unable to start Stackdriver Profiler Python agent. " + str(exc))
+      if attempt < attempts:
+        logger.info("Sleeping %.0f seconds to retry Stackdriver Profiler agent initialization", delay)
+        time.sleep(delay)
+        delay = min(delay * 2, max_backoff)
+  logger.warning("Could not initialize Stackdriver Profiler after retrying, giving up")
+  return False
+
+def _frame_label(code):
+  return "{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno)
+
+class SamplingProfiler(object):
+  """Wall-clock sampling profiler writing collapsed stacks to a directory.
+
+  Every `interval` seconds the stacks of all other threads are read with
+  sys._current_frames() and counted. Every `dump_interval` seconds, and at
+  exit, the counts are written to `<output_dir>/<service>-<pid>-<time>.collapsed`
+  as one "thread;outer;...;inner count" line per distinct stack, the format
+  read by flamegraph.pl and speedscope, and reset.
+  """
+  def __init__(self, service, output_dir, interval=0.01, dump_interval=60.0):
+    self.service = service
+    self.output_dir = output_dir
+    self.interval = interval
+    self.dump_interval = dump_interval
+    self._stacks = collections.Counter()
+    self._lock = threading.Lock()
+    self._stop = threading.Event()
+    self._thread = None
+    self._labels = {}
+
+  def start(self):
+    os.makedirs(self.output_dir, exist_ok=True)
+    self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+    self._thread.start()
+    atexit.register(self.stop)
+
+  def stop(self):
+    if self._thread is None:
+      return
+    self._stop.set()
+    self._thread.join()
+    self._thread = None
+    self.dump()
+
+  def _label(self, code):
+    label = self._labels.get(code)
+    if label is None:
+      label = self._labels[code] = _frame_label(code)
+    return label
+
+  def sample(self):
+    own = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    samples = []
+    for ident, frame in sys._current_frames().items():
+      if ident == own:
+        continue
+      stack = []
+      while frame is not None:
+        stack.append(self._label(frame.f_code))
+        frame = frame.f_back
+      stack.append(names.get(ident, 'thread-{}'.format(ident)))
+      samples.append(';'.join(reversed(stack)))
+    with self._lock:
+      self._stacks.update(samples)
+
+  def dump(self):
+    with self._lock:
+      stacks, self._stacks = self._stacks, collections.Counter()
+    if not stacks:
+      return None
+    path = os.path.join(self.output_dir, '{}-{}-{}.collapsed'.format(
+      self.service, os.getpid(), time.strftime('%Y%m%dT%H%M%S')))
+    with open(path, 'w') as f:
+      for stack, count in stacks.most_common():
+        f.write('{} {}\n'.format(stack, count))
+    return path
+
+  def _run(self):
+    next_dump = time.monotonic() + self.dump_interval
+    while not self._stop.wait(self.interval):
+      self.sample()
+      if time.monotonic() >= next_dump:
+        try:
+          path = self.dump()
+          if path:
+            logger.info("wrote profile %s", path)
+        except OSError as err:
+          logger.warning("could not write profile: %s", err)
+        next_dump = time.monotonic() + self.dump_interval
+
+def init_profiling(service):
+  """Starts the profiler selected by PROFILER_BACKEND unless DISABLE_PROFILER is set."""
+  if "DISABLE_PROFILER" in os.environ:
+    logger.info("Profiler disabled.")
+    return
+  backend = os.environ.get("PROFILER_BACKEND", "cloud")
+  logger.info("Profiler enabled (%s).", backend)
+  if backend == "local":
+    SamplingProfiler(
+      service,
+      os.environ.get("PROFILER_OUTPUT_DIR", "/tmp/profiles"),
+      interval=float(os.environ.get("PROFILER_SAMPLE_INTERVAL_SECONDS", "0.01")),
+      dump_interval=float(os.environ.get("PROFILER_DUMP_INTERVAL_SECONDS", "60"))).start()
+  elif backend == "cloud":
+    threading.Thread(target=initStackdriverProfiling, args=(service,),
+                     name='profiler-init', daemon=True).start()
+  else:
+    raise Exception('unknown PROFILER_BACKEND "{}", expected cloud or local'.format(backend))
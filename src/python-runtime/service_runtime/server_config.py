@@ -0,0 +1,93 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""gRPC server settings read from the environment.
+
+  GRPC_MAX_WORKERS                  size of the handler thread pool (10)
+  GRPC_MAX_CONCURRENT_RPCS          RPCs accepted at once; extra RPCs fail
+                                    fast with RESOURCE_EXHAUSTED (unbounded)
+  GRPC_KEEPALIVE_TIME_MS            interval of server keepalive pings
+  GRPC_KEEPALIVE_TIMEOUT_MS         time to wait for a keepalive ack
+  GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS  allow keepalive pings on idle
+                                    connections (0/1)
+  GRPC_MAX_MESSAGE_LENGTH           max send/receive message size in bytes
+  GRPC_SO_REUSEPORT                 set SO_REUSEPORT on the listening socket
+                                    (0/1)
+
+Unset variables keep the gRPC defaults.
+"""
+
+import os
+from concurrent import futures
+
+import grpc
+
+def _env_int(name, default=None):
+  value = os.environ.get(name, '')
+  if value == '':
+    return default
+  return int(value)
+
+def max_workers():
+  return _env_int('GRPC_MAX_WORKERS', 10)
+
+def max_concurrent_rpcs():
+  # gRPC rejects RPCs above this limit with RESOURCE_EXHAUSTED before they
+  # reach the executor, which keeps its queue bounded during bursts.
+  limit = _env_int('GRPC_MAX_CONCURRENT_RPCS')
+  return limit if limit else None
+
+def server_options():
+  options = []
+  keepalive_time = _env_int('GRPC_KEEPALIVE_TIME_MS')
+  if keepalive_time is not None:
+    options.append(('grpc.keepalive_time_ms', keepalive_time))
+  keepalive_timeout = _env_int('GRPC_KEEPALIVE_TIMEOUT_MS')
+  if keepalive_timeout is not None:
+    options.append(('grpc.keepalive_timeout_ms', keepalive_timeout))
+  permit_without_calls = _env_int('GRPC_KEEPALIVE_PERMIT_WITHOUT_CALLS')
+  if permit_without_calls is not None:
+    options.append(('grpc.keepalive_permit_without_calls', permit_without_calls))
+    options.append(('grpc.http2.max_pings_without_data', 0 if permit_without_calls else 2))
+  max_message_length = _env_int('GRPC_MAX_MESSAGE_LENGTH')
+  if max_message_length is not None:
+    options.append(('grpc.max_send_message_length', max_message_length))
+    options.append(('grpc.max_receive_message_length', max_message_length))
+  so_reuseport = _env_int('GRPC_SO_REUSEPORT')
+  if so_reuseport is not None:
+    options.append(('grpc.so_reuseport', so_reuseport))
+  return options
+
+def new_server(interceptors=None, executor=None):
+  """Creates a thread pool grpc.server configured from the environment.
+
+  `executor` replaces the default ThreadPoolExecutor of GRPC_MAX_WORKERS
+  threads.
+  """
+  if executor is None:
+    executor = futures.ThreadPoolExecutor(max_workers=max_workers())
+  return grpc.server(
+    executor,
+    interceptors=interceptors,
+    options=server_options(),
+    maximum_concurrent_rpcs=max_concurrent_rpcs())
+
+def new_aio_server(interceptors=None):
+  """Creates a grpc.aio server configured from the environment."""
+  return grpc.aio.server(
+    interceptors=interceptors,
+    options=server_options(),
+    maximum_concurrent_rpcs=max_concurrent_rpcs())
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""OpenTelemetry tracing for gRPC servers and clients.
+
+  ENABLE_TRACING           1 to export spans
+  COLLECTOR_SERVICE_ADDR   OTLP collector address (localhost:4317)
+"""
+
+import os
+import traceback
+
+from google.auth.exceptions import DefaultCredentialsError
+from opentelemetry import trace
+from opentelemetry.instrumentation.grpc import (
+    GrpcAioInstrumentorClient, GrpcAioInstrumentorServer, GrpcInstrumentorClient, GrpcInstrumentorServer)
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor
+from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+
+from .logger import getJSONLogger
+logger = getJSONLogger('service-runtime-tracing')
+
+def init_tracing():
+  """Instruments sync and asyncio gRPC servers and clients, and exports
+  spans over OTLP when ENABLE_TRACING=1.
+
+  Call it once per process, before creating servers and channels.
+  """
+  try:
+    GrpcInstrumentorClient().instrument()
+    GrpcInstrumentorServer().instrument()
+    GrpcAioInstrumentorClient().instrument()
+    GrpcAioInstrumentorServer().instrument()
+    if os.environ["ENABLE_TRACING"] == "1":
+      trace.set_tracer_provider(TracerProvider())
+      otel_endpoint = os.getenv("COLLECTOR_SERVICE_ADDR", "localhost:4317")
+      trace.get_tracer_provider().add_span_processor(
+        BatchSpanProcessor(
+            OTLPSpanExporter(
+            endpoint = otel_endpoint,
+            insecure = True
+          )
+        )
+      )
+  except (KeyError, DefaultCredentialsError):
+    logger.info("Tracing disabled.")
+  except Exception:
+    logger.warning(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.")
@@ -1,4 +1,4 @@
-#!/bin/bash -eu
+#!/usr/bin/python
 #
 # Copyright 2018 Google LLC
 #
@@ -14,8 +14,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# [START gke_emailservice_genproto]
+import os
+import sys
 
-python -m grpc_tools.protoc -I../../protos --python_out=. --grpc_python_out=. ../../protos/demo.proto
-
-# [END gke_emailservice_genproto]
\ No newline at end of file
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
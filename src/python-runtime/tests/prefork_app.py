@@ -0,0 +1,52 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Supervisor process for test_prefork.py.
+
+  python prefork_app.py <processes> <state dir> [stubborn]
+
+Each worker writes "<state dir>/started-<pid>" holding its worker index,
+then waits for KeyboardInterrupt and writes "stopped-<pid>". Stubborn
+workers ignore the interrupt and keep running.
+"""
+
+import os
+import sys
+import time
+
+from service_runtime import prefork
+
+def serve():
+  state_dir = os.environ['PREFORK_STATE_DIR']
+  pid = os.getpid()
+  with open(os.path.join(state_dir, 'started-%d' % pid), 'w') as f:
+    f.write(os.environ.get('SERVER_WORKER_INDEX', ''))
+  while True:
+    try:
+      time.sleep(60)
+    except KeyboardInterrupt:
+      if os.environ.get('PREFORK_STUBBORN'):
+        continue
+      with open(os.path.join(state_dir, 'stopped-%d' % pid), 'w'):
+        pass
+      return
+
+if __name__ == '__main__':
+  os.environ['PREFORK_STATE_DIR'] = sys.argv[2]
+  if sys.argv[3:] == ['stubborn']:
+    os.environ['PREFORK_STUBBORN'] = '1'
+  prefork.MIN_WORKER_UPTIME_SECONDS = 0
+  prefork.run(serve, int(sys.argv[1]))
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import sys
+
+import pytest
+
+from service_runtime import logger
+
+FORMAT = '%(timestamp)s %(severity)s %(name)s %(message)s'
+
+
+def records():
+  """Records covering the cases the two formatters handle differently."""
+  try:
+    raise ValueError('bad café')
+  except ValueError:
+    exc_info = sys.exc_info()
+  yield logging.makeLogRecord({'name': 'svc', 'levelname': 'INFO', 'levelno': logging.INFO,
+                               'msg': 'plain'})
+  yield logging.makeLogRecord({'name': 'svc', 'levelname': 'INFO', 'levelno': logging.INFO,
+                               'msg': 'order %s for %d items', 'args': ('Zoë', 3)})
+  yield logging.makeLogRecord({'name': 'svc', 'levelname': 'WARNING', 'levelno': logging.WARNING,
+                               'msg': 'Привет, 世界 ✓'})
+  yield logging.makeLogRecord({'name': 'svc', 'levelname': 'INFO', 'levelno': logging.INFO,
+                               'msg': 'with extras', 'request_id': 'r-1', 'items': [1, 2],
+                               'nested': {'a': 'ü'}, 'unserializable': object})
+  yield logging.makeLogRecord({'name': 'svc', 'levelname': 'INFO', 'levelno': logging.INFO,
+                               'msg': {'event': 'checkout', 'total': 1.5}})
+  yield logging.makeLogRecord({'name': 'svc', 'levelname': 'ERROR', 'levelno': logging.ERROR,
+                               'msg': 'failed', 'exc_info': exc_info})
+  yield logging.makeLogRecord({'name': 'svc', 'levelname': 'INFO', 'levelno': logging.INFO,
+                               'msg': 'custom', 'severity': 'debug', 'timestamp': 1700000000.5})
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def serializer(request, monkeypatch):
+  if request.param == 'orjson':
+    pytest.importorskip('orjson')
+  else:
+    monkeypatch.setattr(logger, 'orjson', None)
+  return request.param
+
+
+@pytest.mark.parametrize('record', list(records()), ids=lambda record: str(record.msg)[:12])
+def test_fast_formatter_matches_custom_formatter(serializer, record):
+  fast = logger.FastJsonFormatter(FORMAT).format(record)
+  custom = logger.CustomJsonFormatter(FORMAT).format(record)
+  assert json.loads(fast) == json.loads(custom)
+
+
+def test_formatter_is_chosen_from_environment(monkeypatch):
+  monkeypatch.setenv('LOG_FORMATTER', 'fast')
+  assert isinstance(logger.newJSONFormatter(), logger.FastJsonFormatter)
+  monkeypatch.delenv('LOG_FORMATTER')
+  assert isinstance(logger.newJSONFormatter(), logger.CustomJsonFormatter)
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from concurrent import futures
+
+import grpc
+import prometheus_client
+import pytest
+
+from service_runtime import metrics
+
+SLOW_SECONDS = 0.05
+
+
+def sample(name, service, method, **labels):
+  value = prometheus_client.REGISTRY.get_sample_value(
+    name, dict(grpc_service=service, grpc_method=method, **labels))
+  return value or 0
+
+
+def handled(service, method, code):
+  return sample('grpc_server_handled_total', service, method, grpc_code=code)
+
+
+# Handlers on raw bytes, so that no generated code is needed.
+
+def slow(request, context):
+  time.sleep(SLOW_SECONDS)
+  return request
+
+def abort(request, context):
+  context.abort(grpc.StatusCode.NOT_FOUND, 'no such product')
+
+def fail(request, context):
+  raise RuntimeError('bug')
+
+def stream(request, context):
+  for _ in range(3):
+    yield request
+
+async def async_slow(request, context):
+  await asyncio.sleep(SLOW_SECONDS)
+  return request
+
+async def async_abort(request, context):
+  await context.abort(grpc.StatusCode.NOT_FOUND, 'no such product')
+
+async def async_fail(request, context):
+  raise RuntimeError('bug')
+
+async def async_stream(request, context):
+  for _ in range(3):
+    yield request
+
+
+def generic_handler(service, slow, abort, fail, stream):
+  return grpc.method_handlers_generic_handler(service, {
+    'Slow': grpc.unary_unary_rpc_method_handler(slow),
+    'Abort': grpc.unary_unary_rpc_method_handler(abort),
+    'Fail': grpc.unary_unary_rpc_method_handler(fail),
+    'Stream': grpc.unary_stream_rpc_method_handler(stream),
+  })
+
+
+def assert_recorded(service):
+  assert handled(service, 'Slow', 'OK') == 2
+  assert handled(service, 'Abort', 'NOT_FOUND') == 1
+  assert handled(service, 'Fail', 'UNKNOWN') == 1
+  assert handled(service, 'Stream', 'OK') == 1
+  assert sample('grpc_server_handling_seconds_count', service, 'Slow') == 2
+  assert sample('grpc_server_handling_seconds_sum', service, 'Slow') >= 2 * SLOW_SECONDS
+  assert sample('grpc_server_handling_seconds_sum', service, 'Abort') < SLOW_SECONDS
+  for method in ('Slow', 'Abort', 'Fail', 'Stream'):
+    assert sample('grpc_server_in_flight', service, method) == 0
+
+
+def test_sync_server_records_codes_and_latency():
+  server = grpc.server(futures.ThreadPoolExecutor(max_workers=4),
+                       interceptors=[metrics.ServerInterceptor()])
+  server.add_generic_rpc_handlers([generic_handler('test.Sync', slow, abort, fail, stream)])
+  port = server.add_insecure_port('127.0.0.1:0')
+  server.start()
+  try:
+    with grpc.insecure_channel('127.0.0.1:%d' % port) as channel:
+      for _ in range(2):
+        assert channel.unary_unary('/test.Sync/Slow')(b'mug') == b'mug'
+      for method, code in (('Abort', grpc.StatusCode.NOT_FOUND), ('Fail', grpc.StatusCode.UNKNOWN)):
+        with pytest.raises(grpc.RpcError) as error:
+          channel.unary_unary('/test.Sync/' + method)(b'mug')
+        assert error.value.code() == code
+      assert list(channel.unary_stream('/test.Sync/Stream')(b'mug')) == [b'mug'] * 3
+  finally:
+    server.stop(None)
+  assert_recorded('test.Sync')
+
+
+def test_aio_server_records_codes_and_latency():
+  async def run():
+    server = grpc.aio.server(interceptors=[metrics.AsyncServerInterceptor()])
+    server.add_generic_rpc_handlers([generic_handler(
+      'test.Aio', async_slow, async_abort, async_fail, async_stream)])
+    port = server.add_insecure_port('127.0.0.1:0')
+    await server.start()
+    try:
+      async with grpc.aio.insecure_channel('127.0.0.1:%d' % port) as channel:
+        for _ in range(2):
+          assert await channel.unary_unary('/test.Aio/Slow')(b'mug') == b'mug'
+        for method, code in (('Abort', grpc.StatusCode.NOT_FOUND), ('Fail', grpc.StatusCode.UNKNOWN)):
+          with pytest.raises(grpc.RpcError) as error:
+            await channel.unary_unary('/test.Aio/' + method)(b'mug')
+          assert error.value.code() == code
+        assert [r async for r in channel.unary_stream('/test.Aio/Stream')(b'mug')] == [b'mug'] * 3
+    finally:
+      await server.stop(None)
+
+  asyncio.run(run())
+  assert_recorded('test.Aio')
+
+
+def test_executor_reports_queue_depth():
+  gauge = 'grpc_server_executor_queue_depth'
+  before = prometheus_client.REGISTRY.get_sample_value(gauge)
+  release = futures.Future()
+  with metrics.InstrumentedExecutor(max_workers=1) as executor:
+    running = executor.submit(release.result)
+    waiting = [executor.submit(lambda: None) for _ in range(3)]
+    deadline = time.monotonic() + 5
+    while prometheus_client.REGISTRY.get_sample_value(gauge) != before + 3:
+      assert time.monotonic() < deadline
+      time.sleep(0.001)
+    release.set_result(None)
+    futures.wait([running] + waiting)
+  assert prometheus_client.REGISTRY.get_sample_value(gauge) == before
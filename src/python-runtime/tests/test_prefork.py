@@ -0,0 +1,103 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def wait_for(condition, timeout=20):
+  deadline = time.monotonic() + timeout
+  while not condition():
+    assert time.monotonic() < deadline, 'timed out'
+    time.sleep(0.05)
+
+
+class Supervisor(object):
+  def __init__(self, state_dir, processes, *args, grace=5):
+    self.state_dir = state_dir
+    env = dict(os.environ, METRICS_PORT='0', SERVER_SHUTDOWN_GRACE_SECONDS=str(grace),
+               PYTHONPATH=os.pathsep.join([os.path.dirname(TESTS_DIR), TESTS_DIR]))
+    self.process = subprocess.Popen(
+      [sys.executable, os.path.join(TESTS_DIR, 'prefork_app.py'), str(processes), str(state_dir)] + list(args),
+      env=env)
+
+  def pids(self, state):
+    prefix = state + '-'
+    return {int(name[len(prefix):]) for name in os.listdir(self.state_dir) if name.startswith(prefix)}
+
+  def index_of(self, pid):
+    with open(os.path.join(self.state_dir, 'started-%d' % pid)) as f:
+      return f.read()
+
+  def stop(self, timeout=20):
+    self.process.send_signal(signal.SIGTERM)
+    return self.process.wait(timeout)
+
+
+@pytest.fixture
+def supervisors():
+  started = []
+  def start(*args, **kwargs):
+    supervisor = Supervisor(*args, **kwargs)
+    started.append(supervisor)
+    return supervisor
+  yield start
+  for supervisor in started:
+    if supervisor.process.poll() is None:
+      supervisor.process.kill()
+      supervisor.process.wait()
+
+
+def test_restarts_dead_workers_and_stops_all(tmp_path, supervisors):
+  supervisor = supervisors(tmp_path, 2)
+  wait_for(lambda: len(supervisor.pids('started')) == 2)
+  first = supervisor.pids('started')
+  assert sorted(supervisor.index_of(pid) for pid in first) == ['0', '1']
+
+  killed = min(first)
+  os.kill(killed, signal.SIGKILL)
+  wait_for(lambda: len(supervisor.pids('started')) == 3)
+  restarted, = supervisor.pids('started') - first
+  assert supervisor.index_of(restarted) == supervisor.index_of(killed)
+
+  assert supervisor.stop() == 0
+  assert supervisor.pids('stopped') == supervisor.pids('started') - {killed}
+
+
+def test_kills_workers_that_do_not_stop_in_time(tmp_path, supervisors):
+  supervisor = supervisors(tmp_path, 2, 'stubborn', grace=0.5)
+  wait_for(lambda: len(supervisor.pids('started')) == 2)
+  started = time.monotonic()
+  assert supervisor.stop() == 0
+  assert 0.5 <= time.monotonic() - started < 10
+  assert supervisor.pids('stopped') == set()
+  for pid in supervisor.pids('started'):
+    with pytest.raises(ProcessLookupError):
+      os.kill(pid, 0)
+
+
+def test_single_process_stops_on_sigterm(tmp_path, supervisors):
+  supervisor = supervisors(tmp_path, 1)
+  wait_for(lambda: supervisor.pids('started') == {supervisor.process.pid})
+  assert supervisor.stop() == 0
+  assert supervisor.pids('stopped') == {supervisor.process.pid}
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import logging
+import threading
+
+import pytest
+
+from service_runtime.logger import AsyncJSONHandler, FastJsonFormatter
+
+FORMAT = '%(timestamp)s %(severity)s %(name)s %(message)s'
+
+
+class RecordingStream(io.StringIO):
+  """StringIO that counts writes."""
+  def __init__(self):
+    super(RecordingStream, self).__init__()
+    self.writes = 0
+
+  def write(self, text):
+    self.writes += 1
+    return super(RecordingStream, self).write(text)
+
+
+def new_logger(handler):
+  logger = logging.getLogger('test-queue-%d' % id(handler))
+  logger.addHandler(handler)
+  logger.setLevel(logging.INFO)
+  logger.propagate = False
+  return logger
+
+
+def lines(stream):
+  return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_writes_records_in_order_and_in_batches():
+  stream = RecordingStream()
+  handler = AsyncJSONHandler(stream, FastJsonFormatter(FORMAT), batch_size=10)
+  logger = new_logger(handler)
+  # Fill the queue before the listener starts so that batches are full.
+  for i in range(25):
+    logger.info('order %d', i)
+  handler.start()
+  handler.stop()
+  assert [line['message'] for line in lines(stream)] == ['order %d' % i for i in range(25)]
+  assert stream.writes == 3
+
+
+def test_resolves_arguments_and_exceptions_on_the_calling_thread():
+  stream = io.StringIO()
+  handler = AsyncJSONHandler(stream, FastJsonFormatter(FORMAT))
+  logger = new_logger(handler)
+  cart = ['mug']
+  logger.info('cart %s', cart)
+  cart.append('lamp')
+  try:
+    raise ValueError('bad order')
+  except ValueError:
+    logger.exception('failed')
+  handler.start()
+  handler.stop()
+  first, second = lines(stream)
+  assert first['message'] == "cart ['mug']"
+  assert 'ValueError: bad order' in second['exc_info']
+
+
+def test_counts_and_reports_dropped_records():
+  stream = io.StringIO()
+  handler = AsyncJSONHandler(stream, FastJsonFormatter(FORMAT), maxsize=5)
+  logger = new_logger(handler)
+  threads = [threading.Thread(target=lambda: [logger.info('tick') for _ in range(100)])
+             for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert handler.dropped == 395
+  handler.start()
+  handler.stop()
+  written = lines(stream)
+  assert len(written) == 6
+  assert written[-1]['severity'] == 'WARNING'
+  assert written[-1]['message'] == '395 log records dropped because the log queue was full'
+
+
+def test_block_overflow_waits_for_room():
+  stream = io.StringIO()
+  handler = AsyncJSONHandler(stream, FastJsonFormatter(FORMAT), maxsize=2, overflow='block')
+  logger = new_logger(handler)
+  handler.start()
+  for i in range(50):
+    logger.info('order %d', i)
+  handler.stop()
+  assert handler.dropped == 0
+  assert len(lines(stream)) == 50
+
+
+def test_rejects_unknown_overflow():
+  with pytest.raises(Exception, match='unknown LOG_QUEUE_OVERFLOW'):
+    AsyncJSONHandler(io.StringIO(), FastJsonFormatter(FORMAT), overflow='grow')
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+
+from service_runtime.logger import RateLimitFilter, _newRateLimitFilter
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+def record(msg, levelno=logging.INFO, args=None):
+  return logging.makeLogRecord({'msg': msg, 'args': args, 'levelno': levelno,
+                                'levelname': logging.getLevelName(levelno)})
+
+
+def test_limits_each_template_to_its_rate():
+  clock = FakeClock()
+  rate_limit = RateLimitFilter(rate=2, burst=2, clock=clock)
+  assert [rate_limit.filter(record('order %s', args=(i,))) for i in range(4)] == [True, True, False, False]
+  # Another template has its own bucket.
+  assert rate_limit.filter(record('cart %s', args=(1,)))
+  clock.now = 0.5
+  assert rate_limit.filter(record('order %s', args=(5,)))
+  assert not rate_limit.filter(record('order %s', args=(6,)))
+
+
+def test_reports_suppressed_count():
+  clock = FakeClock()
+  rate_limit = RateLimitFilter(rate=1, clock=clock)
+  assert rate_limit.filter(record('tick'))
+  for _ in range(3):
+    assert not rate_limit.filter(record('tick'))
+  clock.now = 1.0
+  passed = record('tick')
+  assert rate_limit.filter(passed)
+  assert passed.suppressed == 3
+  clock.now = 2.0
+  passed = record('tick')
+  assert rate_limit.filter(passed)
+  assert not hasattr(passed, 'suppressed')
+
+
+def test_warnings_are_never_dropped():
+  rate_limit = RateLimitFilter(sample_rate=0.0, rate=1, burst=1, clock=FakeClock())
+  assert all(rate_limit.filter(record('disk full', logging.WARNING)) for _ in range(10))
+  assert all(rate_limit.filter(record('failed', logging.ERROR)) for _ in range(10))
+  assert not rate_limit.filter(record('tick'))
+
+
+def test_samples_before_rate_limiting():
+  draws = iter([0.1, 0.9, 0.3, 0.6])
+  rate_limit = RateLimitFilter(sample_rate=0.5, rng=lambda: next(draws))
+  assert [rate_limit.filter(record('tick')) for _ in range(4)] == [True, False, True, False]
+
+
+def test_bounds_the_number_of_templates():
+  rate_limit = RateLimitFilter(rate=1, max_templates=3, clock=FakeClock())
+  for i in range(10):
+    assert rate_limit.filter(record('template %d' % i))
+  assert len(rate_limit._buckets) <= 3
+
+
+def test_is_configured_from_environment(monkeypatch):
+  for name in ('LOG_SAMPLE_RATE', 'LOG_RATE_LIMIT', 'LOG_RATE_BURST'):
+    monkeypatch.delenv(name, raising=False)
+  assert _newRateLimitFilter() is None
+  monkeypatch.setenv('LOG_RATE_LIMIT', '5')
+  monkeypatch.setenv('LOG_RATE_BURST', '20')
+  rate_limit = _newRateLimitFilter()
+  assert (rate_limit.sample_rate, rate_limit.rate, rate_limit.burst) == (1.0, 5.0, 20.0)
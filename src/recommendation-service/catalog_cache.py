@@ -0,0 +1,222 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import functools
+import threading
+import time
+
+import grpc
+
+import demo_pb2
+from product_index import CategoryIndex, ProductIndex
+
+from service_runtime.logger import getJSONLogger
+logger = getJSONLogger('recommendationservice-catalog')
+
+
+class CatalogSnapshot(object):
+    """Immutable view of the product catalog taken at `fetched_at`.
+
+    The category index is only built when `with_categories` is set, since
+    the random recommendation mode does not need it.
+    """
+
+    def __init__(self, products, fetched_at=None, with_categories=False):
+        self.products = tuple(products)
+        self.index = ProductIndex(p.id for p in self.products)
+        self.categories = CategoryIndex(self.products, self.index) if with_categories else None
+        self.fetched_at = time.monotonic() if fetched_at is None else fetched_at
+
+    @property
+    def product_ids(self):
+        return self.index.ids
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class CatalogCache(object):
+    """Caches ListProducts responses from the product catalog service.
+
+    A background thread refreshes the snapshot every `ttl_seconds` and swaps
+    it in with a single reference assignment, so readers never block on the
+    catalog once the first snapshot is loaded. When a refresh fails the
+    previous snapshot keeps being served (stale-while-revalidate) and the
+    refresh is retried with backoff. A `ttl_seconds` of 0 disables caching
+    and fetches the catalog on every call.
+    """
+
+    def __init__(self, stub, ttl_seconds=30.0, timeout_seconds=5.0, with_categories=False):
+        self._stub = stub
+        self._with_categories = with_categories
+        self._ttl = ttl_seconds
+        self._timeout = timeout_seconds
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        # Cold-start loads that have finished, and the error of the last one
+        self._loads = 0
+        self._load_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self._ttl > 0
+
+    def get(self):
+        """Returns the current CatalogSnapshot, loading it if necessary."""
+        if not self.enabled:
+            return self.refresh()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        # Cold start: only one caller goes to the catalog, the others wait
+        # for its result instead of piling up on the downstream service. If
+        # that load fails, the callers that waited for it get its error.
+        loads = self._loads
+        with self._load_lock:
+            if self._snapshot is None:
+                self._raise_failed_load(loads)
+                try:
+                    self.refresh()
+                except Exception as err:
+                    self._load_error = err
+                    raise
+                finally:
+                    self._loads += 1
+            return self._snapshot
+
+    def _raise_failed_load(self, loads):
+        # A load that finished while the caller waited for the lock and left
+        # no snapshot has failed.
+        if self._loads != loads:
+            raise self._load_error
+
+    def refresh(self):
+        """Fetches the catalog and swaps in a new snapshot."""
+        response = self._stub.ListProducts(demo_pb2.Empty(), timeout=self._timeout)
+        snapshot = CatalogSnapshot(response.products, with_categories=self._with_categories)
+        self._snapshot = snapshot
+        return snapshot
+
+    def start(self):
+        """Loads the first snapshot and starts the background refresher."""
+        if not self.enabled or self._thread is not None:
+            return
+        try:
+            self.refresh()
+        except grpc.RpcError as err:
+            logger.warning("Initial catalog load failed, will retry in background: {}".format(err.code()))
+        self._thread = threading.Thread(
+            target=self._run, name='catalog-refresher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        delay = self._ttl
+        while not self._stop.wait(delay):
+            try:
+                self.refresh()
+                delay = self._ttl
+            except grpc.RpcError as err:
+                delay = self._retry_delay(delay, err)
+
+    def _retry_delay(self, delay, err):
+        # Keep serving the previous snapshot and retry with exponential
+        # backoff, starting at 1s and capped at the TTL.
+        delay = 1.0 if delay >= self._ttl else min(self._ttl, delay * 2)
+        snapshot = self._snapshot
+        age = "n/a" if snapshot is None else "%.1fs" % snapshot.age()
+        logger.warning("Catalog refresh failed ({}), serving stale snapshot (age {}), retrying in {:.1f}s".format(
+            err.code(), age, delay))
+        return delay
+
+
+class AsyncCatalogCache(CatalogCache):
+    """CatalogCache for grpc.aio servers.
+
+    Same caching semantics as CatalogCache, but `stub` must be bound to a
+    grpc.aio channel, `get`, `refresh`, `start` and `stop` are coroutines
+    and the refresher runs as an asyncio task instead of a thread. Snapshots
+    are built in the default executor so large catalogs do not stall the
+    event loop.
+    """
+
+    def __init__(self, stub, ttl_seconds=30.0, timeout_seconds=5.0, with_categories=False):
+        super(AsyncCatalogCache, self).__init__(stub, ttl_seconds, timeout_seconds, with_categories)
+        self._load_lock = asyncio.Lock()
+        self._task = None
+
+    async def get(self):
+        if not self.enabled:
+            return await self.refresh()
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        loads = self._loads
+        async with self._load_lock:
+            if self._snapshot is None:
+                self._raise_failed_load(loads)
+                try:
+                    await self.refresh()
+                except Exception as err:
+                    self._load_error = err
+                    raise
+                finally:
+                    self._loads += 1
+            return self._snapshot
+
+    async def refresh(self):
+        response = await self._stub.ListProducts(demo_pb2.Empty(), timeout=self._timeout)
+        loop = asyncio.get_running_loop()
+        snapshot = await loop.run_in_executor(
+            None, functools.partial(CatalogSnapshot, response.products, with_categories=self._with_categories))
+        self._snapshot = snapshot
+        return snapshot
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        try:
+            await self.refresh()
+        except grpc.RpcError as err:
+            logger.warning("Initial catalog load failed, will retry in background: {}".format(err.code()))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        delay = self._ttl
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+                delay = self._ttl
+            except grpc.RpcError as err:
+                delay = self._retry_delay(delay, err)
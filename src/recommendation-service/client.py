@@ -19,7 +19,7 @@ import grpc
 import demo_pb2
 import demo_pb2_grpc
 
-from logger import getJSONLogger
+from service_runtime.logger import getJSONLogger
 logger = getJSONLogger('recommendationservice-server')
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+
+class ProductIndex(object):
+    """Compact product ID array plus an ID -> position map.
+
+    Built once per catalog snapshot so that sampling recommendations does
+    not need to copy or filter the whole catalog on every request.
+    """
+
+    def __init__(self, product_ids):
+        # dict.fromkeys drops duplicate IDs while keeping catalog order.
+        self.ids = tuple(dict.fromkeys(product_ids))
+        self.positions = {product_id: i for i, product_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, product_id):
+        return product_id in self.positions
+
+    def sample(self, k, exclude=(), rng=random):
+        """Returns up to `k` distinct product IDs that are not in `exclude`.
+
+        Positions are drawn uniformly at random and rejected when they are
+        excluded or already picked, which is O(k) expected work as long as
+        the request excludes a small part of the catalog. When most of the
+        catalog is excluded, it falls back to sampling the filtered list.
+        """
+        n = len(self.ids)
+        excluded = {self.positions[p] for p in exclude if p in self.positions}
+        available = n - len(excluded)
+        k = min(k, available)
+        if k <= 0:
+            return []
+        if 2 * (k + len(excluded)) > n:
+            candidates = [i for i in range(n) if i not in excluded]
+            return [self.ids[i] for i in rng.sample(candidates, k)]
+        picked = []
+        seen = set(excluded)
+        while len(picked) < k:
+            i = rng.randrange(n)
+            if i not in seen:
+                seen.add(i)
+                picked.append(self.ids[i])
+        return picked
+
+
+class CategoryIndex(object):
+    """Inverted index category -> product positions in a ProductIndex."""
+
+    def __init__(self, products, index):
+        self.index = index
+        self.categories = [frozenset()] * len(index)
+        postings = {}
+        for product in products:
+            position = index.positions[product.id]
+            categories = frozenset(product.categories)
+            self.categories[position] = categories
+            for category in categories:
+                postings.setdefault(category, []).append(position)
+        self.postings = {c: tuple(positions) for c, positions in postings.items()}
+
+    def categories_of(self, product_ids):
+        """Returns the union of the categories of the given products."""
+        categories = set()
+        for product_id in product_ids:
+            position = self.index.positions.get(product_id)
+            if position is not None:
+                categories |= self.categories[position]
+        return categories
+
+    def candidates(self, categories, budget, rng=random):
+        """Returns up to `budget` positions of products sharing a category.
+
+        Each category contributes at most its share of the budget, sampled
+        at random from its posting list, so the cost does not grow with
+        the size of the catalog.
+        """
+        if not categories or budget <= 0:
+            return set()
+        per_category = max(1, budget // len(categories))
+        positions = set()
+        for category in categories:
+            posting = self.postings.get(category, ())
+            if len(posting) > per_category:
+                posting = [posting[i] for i in rng.sample(range(len(posting)), per_category)]
+            positions.update(posting)
+        return positions
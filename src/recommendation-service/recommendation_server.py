@@ -14,81 +14,47 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import os
-import random
 import time
-import traceback
-from concurrent import futures
 
-import googlecloudprofiler
-from google.auth.exceptions import DefaultCredentialsError
 import grpc
 
 import demo_pb2
 import demo_pb2_grpc
-from grpc_health.v1 import health_pb2
-from grpc_health.v1 import health_pb2_grpc
-
-from opentelemetry import trace
-from opentelemetry.instrumentation.grpc import GrpcInstrumentorClient, GrpcInstrumentorServer
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-
-from logger import getJSONLogger
+from service_runtime import channels, metrics, prefork, server_config
+from service_runtime.health import AsyncHealthCheckMixin, HealthCheckMixin, add_health_servicer
+from service_runtime.logger import getJSONLogger
+from service_runtime.profiling import init_profiling
+from service_runtime.tracing import init_tracing
+
+from catalog_cache import AsyncCatalogCache, CatalogCache
+from recommenders import get_recommender
 logger = getJSONLogger('recommendationservice-server')
 
-def initStackdriverProfiling():
-  project_id = None
-  try:
-    project_id = os.environ["GCP_PROJECT_ID"]
-  except KeyError:
-    # Environment variable not set
-    pass
+class RecommendationService(HealthCheckMixin, demo_pb2_grpc.RecommendationServiceServicer):
+    def __init__(self, catalog, recommender):
+        self.catalog = catalog
+        self.recommender = recommender
 
-  for retry in range(1,4):
-    try:
-      if project_id:
-        googlecloudprofiler.start(service='recommendation_server', service_version='1.0.0', verbose=0, project_id=project_id)
-      else:
-        googlecloudprofiler.start(service='recommendation_server', service_version='1.0.0', verbose=0)
-      logger.info("Successfully started Stackdriver Profiler.")
-      return
-    except (BaseException) as exc:
-      logger.info("Unable to start Stackdriver Profiler Python agent. " + str(exc))
-      if (retry < 4):
-        logger.info("Sleeping %d seconds to retry Stackdriver Profiler agent initialization"%(retry*10))
-        time.sleep (1)
-      else:
-        logger.warning("Could not initialize Stackdriver Profiler after retrying, giving up")
-  return
-
-class RecommendationService(demo_pb2_grpc.RecommendationServiceServicer):
     def ListRecommendations(self, request, context):
+        # pick from the cached catalog snapshot, skipping products in the request
+        return self._recommend(self.catalog.get(), request)
+
+    def _recommend(self, snapshot, request):
         max_responses = 5
-        # fetch list of products from product catalog stub
-        cat_response = product_catalog_stub.ListProducts(demo_pb2.Empty())
-        product_ids = [x.id for x in cat_response.products]
-        filtered_products = list(set(product_ids)-set(request.product_ids))
-        num_products = len(filtered_products)
-        num_return = min(max_responses, num_products)
-        # sample list of indicies to return
-        indices = random.sample(range(num_products), num_return)
-        # fetch product ids from indices
-        prod_list = [filtered_products[i] for i in indices]
-        logger.info("[Recv ListRecommendations] product_ids={}".format(prod_list))
+        prod_list = self.recommender.recommend(snapshot, request.product_ids, max_responses)
+        logger.info("[Recv ListRecommendations] product_ids=%s", prod_list)
         # build and return response
         response = demo_pb2.ListRecommendationsResponse()
         response.product_ids.extend(prod_list)
         return response
 
-    def Check(self, request, context):
-        return health_pb2.HealthCheckResponse(
-            status=health_pb2.HealthCheckResponse.SERVING)
+class AsyncRecommendationService(AsyncHealthCheckMixin, RecommendationService):
+    """RecommendationService for grpc.aio servers, backed by an AsyncCatalogCache."""
 
-    def Watch(self, request, context):
-        return health_pb2.HealthCheckResponse(
-            status=health_pb2.HealthCheckResponse.UNIMPLEMENTED)
+    async def ListRecommendations(self, request, context):
+        return self._recommend(await self.catalog.get(), request)
 
 def test_catalog_connection(stub):
     """Test using existing stub"""
@@ -101,57 +67,30 @@ def test_catalog_connection(stub):
         logger.error(f'❌ Failed to connect: {e.code()} - {e.details()}')
         return False
 
-if __name__ == "__main__":
-    logger.info("initializing recommendationservice")
-
-    try:
-      if "DISABLE_PROFILER" in os.environ:
-        raise KeyError()
-      else:
-        logger.info("Profiler enabled.")
-        initStackdriverProfiling()
-    except KeyError:
-        logger.info("Profiler disabled.")
+def catalog_cache_options(recommender):
+    return dict(
+        ttl_seconds=float(os.environ.get('CATALOG_CACHE_TTL_SECONDS', "30")),
+        timeout_seconds=float(os.environ.get('CATALOG_TIMEOUT_SECONDS', "5")),
+        with_categories=recommender.needs_categories)
 
-    try:
-      grpc_client_instrumentor = GrpcInstrumentorClient()
-      grpc_client_instrumentor.instrument()
-      grpc_server_instrumentor = GrpcInstrumentorServer()
-      grpc_server_instrumentor.instrument()
-      if os.environ["ENABLE_TRACING"] == "1":
-        trace.set_tracer_provider(TracerProvider())
-        otel_endpoint = os.getenv("COLLECTOR_SERVICE_ADDR", "localhost:4317")
-        trace.get_tracer_provider().add_span_processor(
-          BatchSpanProcessor(
-              OTLPSpanExporter(
-              endpoint = otel_endpoint,
-              insecure = True
-            )
-          )
-        )
-    except (KeyError, DefaultCredentialsError):
-        logger.info("Tracing disabled.")
-    except Exception as e:
-        logger.warn(f"Exception on Cloud Trace setup: {traceback.format_exc()}, tracing disabled.") 
-
-    port = os.environ.get('PORT', "8080")
-    catalog_addr = os.environ.get('PRODUCT_CATALOG_SERVICE_ADDR', '')
-    if catalog_addr == "":
-        raise Exception('PRODUCT_CATALOG_SERVICE_ADDR environment variable not set')
-    logger.info("product catalog address: " + catalog_addr)
-    channel = grpc.insecure_channel(catalog_addr)
+def serve(port, catalog_addr, recommender):
+    channel = channels.new_channel(catalog_addr)
     product_catalog_stub = demo_pb2_grpc.ProductCatalogServiceStub(channel)
+    catalog = CatalogCache(product_catalog_stub, **catalog_cache_options(recommender))
 
     # create gRPC server
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = server_config.new_server(
+        interceptors=metrics.server_interceptors(),
+        executor=metrics.new_executor(server_config.max_workers()))
 
     # add class to gRPC server
-    service = RecommendationService()
+    service = RecommendationService(catalog, recommender)
     demo_pb2_grpc.add_RecommendationServiceServicer_to_server(service, server)
-    health_pb2_grpc.add_HealthServicer_to_server(service, server)
+    add_health_servicer(service, server)
 
     if test_catalog_connection(product_catalog_stub):
       logger.info('✅ Connection test passed!')
+    catalog.start()
 
     # start server
     logger.info("listening on port: " + port)
@@ -164,3 +103,59 @@ if __name__ == "__main__":
             time.sleep(10000)
     except KeyboardInterrupt:
             server.stop(0)
+
+async def serve_aio(port, catalog_addr, recommender):
+    """Serves RecommendationService on a grpc.aio server.
+
+    Requests are handled as coroutines on a single event loop, so the number
+    of in-flight recommendations is not bounded by a thread pool.
+    """
+    channel = channels.new_aio_channel(catalog_addr)
+    product_catalog_stub = demo_pb2_grpc.ProductCatalogServiceStub(channel)
+    catalog = AsyncCatalogCache(product_catalog_stub, **catalog_cache_options(recommender))
+
+    server = server_config.new_aio_server(interceptors=metrics.aio_server_interceptors())
+    service = AsyncRecommendationService(catalog, recommender)
+    demo_pb2_grpc.add_RecommendationServiceServicer_to_server(service, server)
+    add_health_servicer(service, server)
+
+    await catalog.start()
+
+    logger.info("listening on port: " + port + " (asyncio)")
+    server.add_insecure_port('[::]:'+port)
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(0)
+        await catalog.stop()
+        await channel.close()
+
+def main():
+    """Initializes profiling, tracing and metrics, then runs the server until it stops.
+
+    Called once per process, so every pre-forked worker sets up its own
+    profiler agent, span exporter, channels and catalog cache.
+    """
+    init_profiling('recommendation_server')
+    init_tracing()
+    metrics.init_metrics()
+
+    port = os.environ.get('PORT', "8080")
+    catalog_addr = os.environ.get('PRODUCT_CATALOG_SERVICE_ADDR', '')
+    if catalog_addr == "":
+        raise Exception('PRODUCT_CATALOG_SERVICE_ADDR environment variable not set')
+    logger.info("product catalog address: " + catalog_addr)
+    recommender = get_recommender(os.environ.get('RECOMMENDATION_MODE', "random"))
+
+    if os.environ.get('GRPC_SERVER_MODE', "sync") == "aio":
+      try:
+        asyncio.run(serve_aio(port, catalog_addr, recommender))
+      except KeyboardInterrupt:
+        pass
+    else:
+      serve(port, catalog_addr, recommender)
+
+if __name__ == "__main__":
+    logger.info("initializing recommendationservice")
+    prefork.run(main, prefork.processes())
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+
+class RandomRecommender(object):
+    """Recommends uniformly random products that are not in the request."""
+    needs_categories = False
+
+    def __init__(self, rng=random):
+        self.rng = rng
+
+    def recommend(self, snapshot, product_ids, k):
+        return snapshot.index.sample(k, exclude=product_ids, rng=self.rng)
+
+
+class CategoryRecommender(RandomRecommender):
+    """Ranks products by how many categories they share with the request.
+
+    Candidates are drawn from the snapshot's CategoryIndex with a fixed
+    budget, so the per-request cost stays O(k) like the random path.
+    Slots that cannot be filled from shared categories fall back to
+    random products.
+    """
+    needs_categories = True
+
+    def __init__(self, candidates_per_slot=8, rng=random):
+        super(CategoryRecommender, self).__init__(rng)
+        self.candidates_per_slot = candidates_per_slot
+
+    def recommend(self, snapshot, product_ids, k):
+        categories = snapshot.categories
+        wanted = categories.categories_of(product_ids)
+        excluded = {snapshot.index.positions[p] for p in product_ids if p in snapshot.index.positions}
+        candidates = list(categories.candidates(wanted, k * self.candidates_per_slot, self.rng) - excluded)
+        # Shuffle first so that products with the same score come out in
+        # random order; the sort below is stable.
+        self.rng.shuffle(candidates)
+        candidates.sort(key=lambda i: len(categories.categories[i] & wanted), reverse=True)
+        prod_list = [snapshot.index.ids[i] for i in candidates[:k]]
+        if len(prod_list) < k:
+            prod_list.extend(snapshot.index.sample(
+                k - len(prod_list), exclude=list(product_ids) + prod_list, rng=self.rng))
+        return prod_list
+
+
+RECOMMENDERS = {
+    'random': RandomRecommender,
+    'category': CategoryRecommender,
+}
+
+
+def get_recommender(mode):
+    try:
+        return RECOMMENDERS[mode]()
+    except KeyError:
+        raise Exception('unknown RECOMMENDATION_MODE "{}", expected one of: {}'.format(
+            mode, ', '.join(sorted(RECOMMENDERS))))
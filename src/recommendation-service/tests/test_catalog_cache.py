@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+import time
+
+import grpc
+import pytest
+
+import demo_pb2
+from catalog_cache import AsyncCatalogCache, CatalogCache
+
+
+class CatalogUnavailable(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.UNAVAILABLE
+
+
+def products(*ids):
+    return [demo_pb2.Product(id=product_id, categories=["kitchen"]) for product_id in ids]
+
+
+class FakeStub(object):
+    """ProductCatalogService stub serving `catalog`, or failing when it is None."""
+
+    def __init__(self, catalog=None, delay=0.0):
+        self.catalog = catalog
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def ListProducts(self, request, timeout=None):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.catalog is None:
+            raise CatalogUnavailable()
+        return demo_pb2.ListProductsResponse(products=self.catalog)
+
+
+class AsyncFakeStub(FakeStub):
+    async def ListProducts(self, request, timeout=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.catalog is None:
+            raise CatalogUnavailable()
+        return demo_pb2.ListProductsResponse(products=self.catalog)
+
+
+def get_concurrently(cache, callers):
+    results = [None] * callers
+
+    def call(i):
+        started = time.monotonic()
+        try:
+            cache.get()
+            outcome = "ok"
+        except grpc.RpcError:
+            outcome = "error"
+        results[i] = (outcome, time.monotonic() - started)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_cold_start_loads_once():
+    stub = FakeStub(products("A", "B"), delay=0.1)
+    cache = CatalogCache(stub, ttl_seconds=30)
+    results = get_concurrently(cache, 6)
+    assert [outcome for outcome, _ in results] == ["ok"] * 6
+    assert stub.calls == 1
+
+
+def test_failed_cold_start_is_shared_with_waiters():
+    stub = FakeStub(None, delay=0.2)
+    cache = CatalogCache(stub, ttl_seconds=30)
+    results = get_concurrently(cache, 6)
+    assert [outcome for outcome, _ in results] == ["error"] * 6
+    assert stub.calls == 1
+    assert max(latency for _, latency in results) < 0.4
+
+    # A caller arriving after the failed load tries again.
+    stub.catalog = products("A")
+    assert cache.get().product_ids == ("A",)
+    assert stub.calls == 2
+
+
+def test_serves_stale_snapshot_while_refresh_fails():
+    stub = FakeStub(products("A", "B"))
+    cache = CatalogCache(stub, ttl_seconds=0.05)
+    cache.start()
+    try:
+        first = cache.get()
+        stub.catalog = None
+        time.sleep(0.2)
+        assert stub.calls > 1
+        assert cache.get() is first
+
+        stub.catalog = products("C")
+        deadline = time.monotonic() + 2
+        while cache.get().product_ids != ("C",):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        cache.stop()
+
+
+def test_start_survives_failed_initial_load():
+    stub = FakeStub(None)
+    cache = CatalogCache(stub, ttl_seconds=30)
+    cache.start()
+    try:
+        with pytest.raises(grpc.RpcError):
+            cache.get()
+    finally:
+        cache.stop()
+
+
+def test_ttl_zero_fetches_every_time():
+    stub = FakeStub(products("A"))
+    cache = CatalogCache(stub, ttl_seconds=0)
+    cache.get()
+    cache.get()
+    assert stub.calls == 2
+
+
+def test_async_failed_cold_start_is_shared_with_waiters():
+    async def main():
+        stub = AsyncFakeStub(None, delay=0.2)
+        cache = AsyncCatalogCache(stub, ttl_seconds=30)
+        started = time.monotonic()
+        results = await asyncio.gather(*(cache.get() for _ in range(6)), return_exceptions=True)
+        assert all(isinstance(result, grpc.RpcError) for result in results)
+        assert stub.calls == 1
+        assert time.monotonic() - started < 0.4
+
+        stub.catalog = products("A")
+        assert (await cache.get()).product_ids == ("A",)
+        assert stub.calls == 2
+
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import random
+
+import pytest
+
+from product_index import ProductIndex
+
+
+class RecordingRandom(random.Random):
+    """Seeded Random that records which sampling method was used."""
+
+    def __init__(self, seed=0):
+        super(RecordingRandom, self).__init__(seed)
+        self.methods = set()
+
+    def randrange(self, *args, **kwargs):
+        self.methods.add("randrange")
+        return super(RecordingRandom, self).randrange(*args, **kwargs)
+
+    def sample(self, *args, **kwargs):
+        self.methods.add("sample")
+        return super(RecordingRandom, self).sample(*args, **kwargs)
+
+
+def catalog(n):
+    return ProductIndex("P%02d" % i for i in range(n))
+
+
+# (catalog size, k, excluded count, expected method): rejection sampling
+# while 2 * (k + excluded) <= n, the filtered list above that.
+PATHS = [
+    (20, 3, 2, "randrange"),
+    (10, 3, 3, "sample"),
+]
+
+
+def test_drops_duplicate_ids():
+    index = ProductIndex(["A", "B", "A", "C"])
+    assert index.ids == ("A", "B", "C")
+    assert index.positions == {"A": 0, "B": 1, "C": 2}
+
+
+@pytest.mark.parametrize("n,k,excluded,method", PATHS)
+def test_sample_is_distinct_and_respects_exclusions(n, k, excluded, method):
+    index = catalog(n)
+    exclude = list(index.ids[:excluded]) + ["UNKNOWN"]
+    rng = RecordingRandom()
+    for _ in range(200):
+        picked = index.sample(k, exclude=exclude, rng=rng)
+        assert len(picked) == k
+        assert len(set(picked)) == k
+        assert not set(picked) & set(exclude)
+    assert rng.methods == {method}
+
+
+@pytest.mark.parametrize("n,k,excluded,method", PATHS)
+def test_sample_is_uniform(n, k, excluded, method):
+    index = catalog(n)
+    exclude = index.ids[:excluded]
+    rng = RecordingRandom()
+    draws = 20000
+    counts = collections.Counter()
+    for _ in range(draws):
+        counts.update(index.sample(k, exclude=exclude, rng=rng))
+    eligible = index.ids[excluded:]
+    assert set(counts) == set(eligible)
+    expected = draws * k / len(eligible)
+    for product_id in eligible:
+        assert abs(counts[product_id] - expected) < 0.1 * expected
+
+
+def test_sample_returns_what_is_left():
+    index = catalog(5)
+    assert sorted(index.sample(10, exclude=["P00", "P01"])) == ["P02", "P03", "P04"]
+    assert index.sample(3, exclude=index.ids) == []
+    assert catalog(0).sample(3) == []
@@ -0,0 +1,90 @@
+#!/usr/bin/python
+#
+# Copyright 2018 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import random
+
+import pytest
+
+import demo_pb2
+from catalog_cache import CatalogSnapshot
+from recommenders import CategoryRecommender, RandomRecommender, get_recommender
+
+
+def snapshot(catalog):
+    products = [demo_pb2.Product(id=product_id, categories=categories)
+                for product_id, categories in catalog.items()]
+    return CatalogSnapshot(products, with_categories=True)
+
+
+CATALOG = snapshot({
+    "mug": ["kitchen"],
+    "jar": ["kitchen"],
+    "kettle": ["kitchen", "vintage"],
+    "radio": ["vintage"],
+    "lamp": ["home"],
+    "sofa": ["home"],
+    "rug": ["home"],
+})
+
+
+def test_candidates_share_a_category():
+    categories = CATALOG.categories
+    positions = categories.candidates({"kitchen"}, budget=10, rng=random.Random(0))
+    assert {CATALOG.index.ids[i] for i in positions} == {"mug", "jar", "kettle"}
+
+
+def test_candidates_stay_within_budget_per_category():
+    categories = CATALOG.categories
+    rng = random.Random(0)
+    for _ in range(50):
+        positions = categories.candidates({"kitchen", "home"}, budget=4, rng=rng)
+        ids = {CATALOG.index.ids[i] for i in positions}
+        assert len(ids & {"mug", "jar", "kettle"}) == 2
+        assert len(ids & {"lamp", "sofa", "rug"}) == 2
+    assert categories.candidates(set(), budget=4) == set()
+    assert categories.candidates({"kitchen"}, budget=0) == set()
+
+
+def test_ranks_by_shared_categories():
+    recommender = CategoryRecommender(rng=random.Random(0))
+    # The kettle shares both categories of the request's products.
+    for _ in range(20):
+        picked = recommender.recommend(CATALOG, ["mug", "radio"], 2)
+        assert picked[0] == "kettle"
+        assert picked[1] == "jar"
+
+
+def test_fills_from_other_categories():
+    recommender = CategoryRecommender(rng=random.Random(0))
+    for _ in range(20):
+        picked = recommender.recommend(CATALOG, ["radio"], 4)
+        assert picked[0] == "kettle"
+        assert len(set(picked)) == 4
+        assert "radio" not in picked
+
+
+def test_unknown_products_get_random_recommendations():
+    recommender = CategoryRecommender(rng=random.Random(0))
+    picked = recommender.recommend(CATALOG, ["unknown"], 3)
+    assert len(set(picked)) == 3
+    assert set(picked) <= set(CATALOG.index.ids)
+
+
+def test_get_recommender():
+    assert isinstance(get_recommender("random"), RandomRecommender)
+    assert isinstance(get_recommender("category"), CategoryRecommender)
+    with pytest.raises(Exception, match="unknown RECOMMENDATION_MODE"):
+        get_recommender("popular")
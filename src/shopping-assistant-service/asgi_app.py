@@ -0,0 +1,87 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Async variant of the shopping assistant, served by an ASGI server.
+
+Same endpoint as shoppingassistantservice.create_app() and the same
+rag.DesignPipeline, but the model, embedding and vector store calls are
+awaited instead of blocking a thread, so one worker process can hold many
+requests that are waiting on Gemini or AlloyDB.
+
+  python asgi_app.py
+  uvicorn asgi_app:create_asgi_app --factory --host 0.0.0.0 --port 8080 --workers 4
+"""
+
+import os
+from urllib.parse import unquote
+
+import uvicorn
+from quart import Quart, Response, request
+
+from deferred import NotReady
+from llm_clients import new_chat_model_pool
+from rag import DesignRequest
+from shoppingassistantservice import (
+    SSE_DONE, SSE_ERROR, SSE_HEADERS, new_pipeline, not_ready, readiness, sse_data, vectorstore)
+
+
+async def sse_events(pieces):
+    """Async counterpart of shoppingassistantservice.sse_events."""
+    try:
+        async for piece in pieces:
+            if piece:
+                yield sse_data(piece)
+    except Exception as e:
+        print(f"Streaming failed: {e}")
+        yield SSE_ERROR
+        return
+    yield SSE_DONE
+
+
+def sse_response(pieces):
+    return Response(sse_events(pieces), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+def create_asgi_app():
+    app = Quart(__name__)
+    vectorstore.start()
+    app.register_error_handler(NotReady, not_ready)
+    app.add_url_rule("/ready", "ready", readiness)
+
+    pipeline = new_pipeline(new_chat_model_pool())
+
+    @app.route("/", methods=['POST'])
+    async def talkToGemini():
+        print("Beginning RAG call")
+        body = await request.get_json()
+        design_request = DesignRequest(unquote(body['message']), body['image'])
+        if bool(body.get('stream')) or request.accept_mimetypes.best == "text/event-stream":
+            return sse_response(await pipeline.aanswer(design_request, stream=True))
+        return {'content': await pipeline.aanswer(design_request)}
+
+    return app
+
+
+if __name__ == "__main__":
+    # Each worker is a separate process that imports this module and builds
+    # its own clients and vector store connection.
+    uvicorn.run(
+        "asgi_app:create_asgi_app",
+        factory=True,
+        host="0.0.0.0",
+        port=8080,
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+    )
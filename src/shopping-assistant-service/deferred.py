@@ -0,0 +1,80 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+
+
+class NotReady(Exception):
+    """Raised when a Deferred value is requested before it is built."""
+
+
+class Deferred:
+    """A value built by `factory` in a background thread.
+
+    `start()` returns immediately; the factory is retried with exponential
+    backoff, from `initial_backoff` up to `max_backoff` seconds, until it
+    succeeds. `get()` returns the value once it is available and raises
+    NotReady before that, so callers can fail fast instead of blocking.
+    """
+
+    def __init__(self, name, factory, initial_backoff=1.0, max_backoff=30.0):
+        self.name = name
+        self.factory = factory
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.attempts = 0
+        self.last_error = None
+        self._value = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"init-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        started_at = time.monotonic()
+        delay = self.initial_backoff
+        while True:
+            self.attempts += 1
+            try:
+                value = self.factory()
+            except Exception as e:
+                self.last_error = e
+                print(f"Initializing {self.name} failed (attempt {self.attempts}), retrying in {delay:g}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+                continue
+            self._value = value
+            self.last_error = None
+            self._ready.set()
+            print(f"Initialized {self.name} in {time.monotonic() - started_at:.1f}s")
+            return
+
+    def get(self, timeout=0):
+        """Returns the value, waiting up to `timeout` seconds for it."""
+        if not self._ready.wait(timeout):
+            raise NotReady(f"{self.name} is not ready")
+        return self._value
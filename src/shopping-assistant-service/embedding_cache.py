@@ -0,0 +1,236 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import unicodedata
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize(text):
+    """Collapses whitespace and case so near-identical queries share a key."""
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+def text_key(text, kind):
+    # Queries and documents are embedded with different task types, so
+    # they live in separate key spaces.
+    return hashlib.sha256((kind + ":" + normalize(text)).encode("utf-8")).digest()
+
+
+class MmapEmbeddingStore:
+    """Append-only on-disk embedding store read through a memory map.
+
+    Each record is a 32-byte key, a uint32 dimension and the vector as
+    float32. The key -> offset index is rebuilt by scanning the file when
+    the store is opened, so embeddings survive restarts.
+
+    Several processes, e.g. the workers started with WEB_CONCURRENCY, can
+    share one file. Records are appended with O_APPEND under an exclusive
+    flock, and a process scans the records added by others (under a shared
+    flock) before it reports a miss or writes.
+    """
+
+    _HEADER = struct.Struct("<32sI")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._offsets = {}
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._map = None
+        self._mapped_size = 0
+        self._size = 0
+        with self._file_lock(fcntl.LOCK_EX):
+            self._scan()
+            self._truncate_partial_record()
+
+    @contextlib.contextmanager
+    def _file_lock(self, operation):
+        fcntl.flock(self._fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _remap(self, size):
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+        self._mapped_size = size
+
+    def _scan(self):
+        """Indexes the records appended since the last scan; needs the file lock."""
+        size = os.fstat(self._fd).st_size
+        if size <= self._size:
+            return
+        self._remap(size)
+        offset = self._size
+        while offset + self._HEADER.size <= size:
+            key, dim = self._HEADER.unpack_from(self._map, offset)
+            end = offset + self._HEADER.size + 4 * dim
+            if end > size:
+                break  # truncated record from an interrupted write
+            self._offsets.setdefault(key, (offset + self._HEADER.size, dim))
+            offset = end
+        self._size = offset
+
+    def _truncate_partial_record(self):
+        # Needs the exclusive file lock. Only a writer that died mid-write
+        # leaves a partial record, and records appended after it would be
+        # unreadable.
+        if os.fstat(self._fd).st_size > self._size:
+            os.ftruncate(self._fd, self._size)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._offsets.get(key)
+            if entry is None:
+                with self._file_lock(fcntl.LOCK_SH):
+                    self._scan()
+                entry = self._offsets.get(key)
+                if entry is None:
+                    return None
+            offset, dim = entry
+            if offset + 4 * dim > self._mapped_size:
+                self._remap(self._size)
+            vector = array("f")
+            vector.frombytes(self._map[offset:offset + 4 * dim])
+            return vector.tolist()
+
+    def put(self, key, vector):
+        data = array("f", vector).tobytes()
+        with self._lock:
+            if key in self._offsets:
+                return
+            with self._file_lock(fcntl.LOCK_EX):
+                self._scan()
+                if key in self._offsets:
+                    return
+                self._truncate_partial_record()
+                os.write(self._fd, self._HEADER.pack(key, len(vector)) + data)
+                self._offsets[key] = (self._size + self._HEADER.size, len(vector))
+                self._size += self._HEADER.size + len(data)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            os.close(self._fd)
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings service with an in-memory LRU and optional disk store.
+
+    Texts are keyed by the SHA-256 of their normalized form, so repeated and
+    whitespace/case-only variants of a query are embedded once. Only misses
+    are sent to the wrapped service, in a single batch.
+    """
+
+    def __init__(self, embeddings, maxsize=4096, store=None):
+        self.embeddings = embeddings
+        self.maxsize = maxsize
+        self.store = store
+        self._lru = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vector
+        if self.store is not None:
+            vector = self.store.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                with self._lock:
+                    self.hits += 1
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def _store(self, key, vector):
+        self._remember(key, vector)
+        if self.store is not None:
+            self.store.put(key, vector)
+
+    def _split(self, texts):
+        """Returns cached vectors (None for misses) and misses grouped by key."""
+        keys = [text_key(t, "document") for t in texts]
+        vectors = [self._lookup(k) for k in keys]
+        missing = collections.OrderedDict()
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        return vectors, missing
+
+    def _merge(self, vectors, missing, computed):
+        for (key, positions), vector in zip(missing.items(), computed):
+            vector = list(vector)
+            self._store(key, vector)
+            for i in positions:
+                vectors[i] = vector
+        return vectors
+
+    def embed_documents(self, texts):
+        vectors, missing = self._split(texts)
+        if missing:
+            computed = self.embeddings.embed_documents([texts[p[0]] for p in missing.values()])
+            self._merge(vectors, missing, computed)
+        return vectors
+
+    def embed_query(self, text):
+        key = text_key(text, "query")
+        vector = self._lookup(key)
+        if vector is None:
+            vector = list(self.embeddings.embed_query(text))
+            self._store(key, vector)
+        return vector
+
+    async def aembed_documents(self, texts):
+        vectors, missing = self._split(texts)
+        if missing:
+            computed = await self.embeddings.aembed_documents([texts[p[0]] for p in missing.values()])
+            self._merge(vectors, missing, computed)
+        return vectors
+
+    async def aembed_query(self, text):
+        key = text_key(text, "query")
+        vector = self._lookup(key)
+        if vector is None:
+            vector = list(await self.embeddings.aembed_query(text))
+            self._store(key, vector)
+        return vector
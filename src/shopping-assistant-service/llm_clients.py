@@ -0,0 +1,56 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import itertools
+import os
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+
+class ChatModelPool:
+    """Fixed set of long-lived chat model clients handed out round-robin.
+
+    Each client owns its own transport (a gRPC channel by default), which
+    multiplexes concurrent requests, so the pool size bounds the number of
+    connections to the Gemini API rather than the number of requests.
+    Clients are safe to share between threads.
+    """
+
+    def __init__(self, factory, size=1):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self._clients = [factory() for _ in range(size)]
+        self._next = itertools.count()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self):
+        return self._clients[next(self._next) % len(self._clients)]
+
+
+def new_chat_model_pool():
+    """Builds a ChatModelPool configured from the environment."""
+    model = os.environ.get("LLM_MODEL", "gemini-1.5-flash")
+    options = {}
+    if os.environ.get("LLM_TRANSPORT"):
+        options["transport"] = os.environ["LLM_TRANSPORT"]
+    if os.environ.get("LLM_TIMEOUT_SECONDS"):
+        options["timeout"] = float(os.environ["LLM_TIMEOUT_SECONDS"])
+    return ChatModelPool(
+        lambda: ChatGoogleGenerativeAI(model=model, **options),
+        size=int(os.environ.get("LLM_CLIENT_POOL_SIZE", "2")),
+    )
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_google_alloydb_pg import AlloyDBLoader
+
+METADATA_COLUMNS = ("id", "name", "categories")
+
+
+def _as_vector(value):
+    # pgvector columns are read as text, e.g. "[0.1,0.2,...]"
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def alloydb_loader(engine, table_name):
+    """Returns a loader reading products and their embeddings from AlloyDB.
+
+    The loader yields (document, embedding) pairs built from the same
+    columns as the AlloyDBVectorStore in shoppingassistantservice.py.
+    """
+    query = (
+        f'SELECT "id", "name", "categories", "description", '
+        f'"product_embedding"::text AS "product_embedding" FROM "{table_name}"'
+    )
+    loader = AlloyDBLoader.create_sync(
+        engine=engine,
+        query=query,
+        content_columns=["description"],
+        metadata_columns=list(METADATA_COLUMNS) + ["product_embedding"],
+    )
+
+    def load():
+        for doc in loader.lazy_load():
+            embedding = doc.metadata.pop("product_embedding")
+            yield doc, embedding
+
+    return load
+
+
+def file_loader(path, embedding_service):
+    """Returns a loader reading products from a JSON-lines file.
+
+    Each line holds "id", "name", "categories" and "description", and
+    optionally a precomputed "product_embedding". Products without one are
+    embedded with `embedding_service` in a single batch.
+    """
+    def load():
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        missing = [row for row in rows if not row.get("product_embedding")]
+        if missing:
+            vectors = embedding_service.embed_documents([row["description"] for row in missing])
+            for row, vector in zip(missing, vectors):
+                row["product_embedding"] = vector
+        for row in rows:
+            doc = Document(
+                page_content=row["description"],
+                metadata={column: row.get(column) for column in METADATA_COLUMNS},
+            )
+            yield doc, row["product_embedding"]
+
+    return load
+
+
+class LocalVectorIndex:
+    """In-memory cosine similarity search over the product catalog.
+
+    Product embeddings are held as rows of an L2-normalized float32 matrix,
+    so a search is one matrix-vector product followed by a partial sort for
+    the top `k`. `loader` is called on `refresh()` and returns an iterable of
+    (document, embedding) pairs; the new index replaces the old one in a
+    single assignment, so searches never see a half-built index.
+
+    With `refresh_seconds` > 0, `start()` reloads the index in a background
+    thread at that interval. Failed reloads keep the current index.
+    """
+
+    def __init__(self, embedding_service, loader, refresh_seconds=300.0):
+        self.embedding_service = embedding_service
+        self.loader = loader
+        self.refresh_seconds = refresh_seconds
+        self._index = ((), np.zeros((0, 0), dtype=np.float32))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._index[0])
+
+    def refresh(self):
+        docs, vectors = [], []
+        for doc, embedding in self.loader():
+            docs.append(doc)
+            vectors.append(_as_vector(embedding))
+        matrix = _normalize_rows(np.vstack(vectors)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self._index = (tuple(docs), matrix)
+        print(f"Loaded {len(docs)} products into the local vector index")
+
+    def start(self):
+        self.refresh()
+        if self.refresh_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name="local-vector-index", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Local vector index refresh failed, keeping current index: {e}")
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4):
+        docs, matrix = self._index
+        if not docs or k <= 0:
+            return []
+        query = _as_vector(embedding)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = matrix @ query
+        if k < len(docs):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(docs))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(docs[i], float(scores[i])) for i in top]
+
+    def similarity_search_by_vector(self, embedding, k=4):
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k)]
+
+    def similarity_search(self, query, k=4):
+        return self.similarity_search_by_vector(self.embedding_service.embed_query(query), k=k)
+
+    async def asimilarity_search(self, query, k=4):
+        embedding = await self.embedding_service.aembed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k)
@@ -0,0 +1,313 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import math
+
+from langchain_core.messages import HumanMessage
+
+
+def cosine_similarity(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def rerank(docs, doc_vectors, query_vector, k=4, prior_weight=0.3):
+    """Re-orders `docs` by similarity to `query_vector` and keeps the top `k`.
+
+    `docs` are candidates from an earlier search, best first. Their original
+    rank is kept as a prior with weight `prior_weight`, so a candidate that
+    matched the user's request well is not dropped just because it is a
+    slightly weaker match for the room description.
+    """
+    n = len(docs)
+    scored = []
+    for rank, (doc, vector) in enumerate(zip(docs, doc_vectors)):
+        prior = 1.0 - rank / n
+        score = (1.0 - prior_weight) * cosine_similarity(vector, query_vector) + prior_weight * prior
+        scored.append((score, rank, doc))
+    scored.sort(key=lambda s: (-s[0], s[1]))
+    return [doc for _, _, doc in scored[:k]]
+
+
+# Rough size of a token in characters, for budgeting without a tokenizer call
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate(text, max_chars):
+    """Shortens `text` to at most `max_chars`, cutting at a word boundary."""
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars - 1]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut + "…"
+
+
+def product_line(doc, max_description_chars=300):
+    metadata = doc.metadata
+    return "ID: {} | Name: {} | Categories: {} | Description: {}".format(
+        metadata.get("id", ""),
+        metadata.get("name", ""),
+        metadata.get("categories", ""),
+        truncate(doc.page_content, max_description_chars),
+    )
+
+
+def build_context(docs, max_description_chars=300, token_budget=1000):
+    """Formats `docs` as one line per product for the design prompt.
+
+    Only the id, name, categories and a truncated description are kept.
+    Products are added best first until the next one would exceed
+    `token_budget` estimated tokens; the first one is always kept.
+    """
+    lines = []
+    used = 0
+    for doc in docs:
+        line = product_line(doc, max_description_chars)
+        tokens = estimate_tokens(line) + 1
+        if lines and used + tokens > token_budget:
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(lines)
+
+
+def room_description_message(image):
+    return HumanMessage(
+        content=[
+            {
+                "type": "text",
+                "text": "You are a professional interior designer, give me a detailed decsription of the style of the room in this image",
+            },
+            {"type": "image_url", "image_url": image},
+        ]
+    )
+
+
+def vector_search_prompt(prompt, description_response):
+    return f""" This is the user's request: {prompt} Find the most relevant items for that prompt, while matching style of the room described here: {description_response} """
+
+
+def design_prompt(description_response, relevant_docs, prompt):
+    return (
+        f" You are an interior designer that works for Online Boutique. You are tasked with providing recommendations to a customer on what they should add to a given room from our catalog. This is the description of the room: \n"
+        f"{description_response} Here are a list of products that are relevant to it: {relevant_docs} Specifically, this is what the customer has asked for, see if you can accommodate it: {prompt} Start by repeating a brief description of the room's design to the customer, then provide your recommendations. Do your best to pick the most relevant item out of the list of products provided, but if none of them seem relevant, then say that instead of inventing a new product. At the end of the response, add a list of the IDs of the relevant products in the following format for the top 3 results: [<first product ID>], [<second product ID>], [<third product ID>] ")
+
+
+class DesignRequest:
+    """A user prompt and room image, with their cache keys."""
+
+    def __init__(self, prompt, image):
+        self.prompt = prompt
+        self.image = image
+        self.image_key = hashlib.sha256(image.encode("utf-8")).hexdigest()
+        self.answer_key = (self.image_key, prompt)
+
+
+class DesignPipeline:
+    """The RAG steps behind the shopping assistant's POST /.
+
+    1. Describe the room in the image with the vision model.
+    2. Search the vector store with the description and the prompt.
+    3. Ask the model for recommendations from the products found.
+
+    `answer` serves the Flask app and `aanswer` the ASGI app. Both go through
+    the same caches and helpers; only the model, embedding and store calls
+    differ, as blocking calls or awaited ones. `vectorstore` is a Deferred
+    whose `get()` raises NotReady until the store is connected.
+
+    With `parallel` set, step 1 runs while the vector store is searched on
+    the prompt alone; the `candidates` results are then re-ranked by
+    similarity to the description. The sync path runs the vision call on
+    `executor`.
+    """
+
+    def __init__(self, llms, embedding_service, vectorstore, description_cache, answer_cache,
+                 executor=None, parallel=False, candidates=12, top_k=4,
+                 context_description_chars=300, context_token_budget=1000):
+        self.llms = llms
+        self.embedding_service = embedding_service
+        self.vectorstore = vectorstore
+        self.description_cache = description_cache
+        self.answer_cache = answer_cache
+        self.executor = executor
+        self.parallel = parallel
+        self.candidates = candidates
+        self.top_k = top_k
+        self.context_description_chars = context_description_chars
+        self.context_token_budget = context_token_budget
+
+    def relevant_docs_context(self, docs):
+        """Prepares relevant documents for inclusion in the final prompt."""
+        relevant_docs = build_context(docs, max_description_chars=self.context_description_chars, token_budget=self.context_token_budget)
+        print(f"Prompt context: about {estimate_tokens(relevant_docs)} tokens for {len(docs)} retrieved documents")
+        return relevant_docs
+
+    def _cached_answer(self, request):
+        content = self.answer_cache.get(request.answer_key)
+        if content is not None:
+            print("Answer cache hit")
+        return content
+
+    def _remember_description(self, request, description):
+        print("Description step:")
+        print(description)
+        self.description_cache.set(request.image_key, description)
+        return description
+
+    def _abandon_description(self, request, pending):
+        """Cancels a description call whose search step failed.
+
+        A thread pool call that has already started cannot be cancelled;
+        its description is cached when it completes, for the client's retry.
+        """
+        if pending is None or pending.cancel():
+            return
+
+        def remember(done):
+            if not done.cancelled() and done.exception() is None:
+                self.description_cache.set(request.image_key, done.result())
+        pending.add_done_callback(remember)
+
+    def _search_prompt(self, request, description):
+        search_prompt = vector_search_prompt(request.prompt, description)
+        print(search_prompt)
+        return search_prompt
+
+    def _final_prompt(self, request, description, docs):
+        print(f"Vector search: {description}")
+        print(f"Retrieved documents: {len(docs)}")
+        final_prompt = design_prompt(description, self.relevant_docs_context(docs), request.prompt)
+        print("Final design prompt: ")
+        print(final_prompt)
+        return final_prompt
+
+    def _cache_when_complete(self, pieces, request):
+        """Passes `pieces` through and caches their concatenation at the end."""
+        parts = []
+        for piece in pieces:
+            parts.append(piece)
+            yield piece
+        self.answer_cache.set(request.answer_key, "".join(parts))
+
+    async def _acache_when_complete(self, pieces, request):
+        parts = []
+        async for piece in pieces:
+            parts.append(piece)
+            yield piece
+        self.answer_cache.set(request.answer_key, "".join(parts))
+
+    # Blocking calls, for the Flask app
+
+    def describe_room(self, request):
+        response = self.llms.get().invoke([room_description_message(request.image)])
+        return self._remember_description(request, response.content)
+
+    def _search(self, request, store):
+        description = self.description_cache.get(request.image_key)
+        if not self.parallel:
+            if description is None:
+                description = self.describe_room(request)
+            return description, store.similarity_search(self._search_prompt(request, description))
+
+        # Search on the user prompt alone while the vision call runs, and
+        # embed the candidates so that re-ranking only needs the
+        # description's embedding once it arrives.
+        pending = None
+        if description is None:
+            pending = self.executor.submit(self.describe_room, request)
+        try:
+            candidates = store.similarity_search(request.prompt, k=self.candidates)
+            candidate_vectors = self.embedding_service.embed_documents([doc.page_content for doc in candidates])
+        except BaseException:
+            self._abandon_description(request, pending)
+            raise
+        if pending is not None:
+            description = pending.result()
+        query_vector = self.embedding_service.embed_query(description)
+        return description, rerank(candidates, candidate_vectors, query_vector, k=self.top_k)
+
+    def answer(self, request, stream=False):
+        """Returns the answer, or an iterator of its pieces if `stream` is set."""
+        content = self._cached_answer(request)
+        if content is not None:
+            return iter([content]) if stream else content
+        store = self.vectorstore.get()
+        description, docs = self._search(request, store)
+        final_prompt = self._final_prompt(request, description, docs)
+        llm = self.llms.get()
+        if stream:
+            pieces = (chunk.content for chunk in llm.stream(final_prompt))
+            return self._cache_when_complete(pieces, request)
+        content = llm.invoke(final_prompt).content
+        self.answer_cache.set(request.answer_key, content)
+        return content
+
+    # Awaited calls, for the ASGI app
+
+    async def adescribe_room(self, request):
+        response = await self.llms.get().ainvoke([room_description_message(request.image)])
+        return self._remember_description(request, response.content)
+
+    async def _asearch(self, request, store):
+        description = self.description_cache.get(request.image_key)
+        if not self.parallel:
+            if description is None:
+                description = await self.adescribe_room(request)
+            return description, await store.asimilarity_search(self._search_prompt(request, description))
+
+        pending = None
+        if description is None:
+            pending = asyncio.create_task(self.adescribe_room(request))
+        try:
+            candidates = await store.asimilarity_search(request.prompt, k=self.candidates)
+            candidate_vectors = await self.embedding_service.aembed_documents([doc.page_content for doc in candidates])
+        except BaseException:
+            self._abandon_description(request, pending)
+            raise
+        if pending is not None:
+            description = await pending
+        query_vector = await self.embedding_service.aembed_query(description)
+        return description, rerank(candidates, candidate_vectors, query_vector, k=self.top_k)
+
+    async def aanswer(self, request, stream=False):
+        """Async `answer`; the pieces are an async iterator."""
+        content = self._cached_answer(request)
+        if content is not None:
+            return _async_iter([content]) if stream else content
+        store = self.vectorstore.get()
+        description, docs = await self._asearch(request, store)
+        final_prompt = self._final_prompt(request, description, docs)
+        llm = self.llms.get()
+        if stream:
+            pieces = (chunk.content async for chunk in llm.astream(final_prompt))
+            return self._acache_when_complete(pieces, request)
+        content = (await llm.ainvoke(final_prompt)).content
+        self.answer_cache.set(request.answer_key, content)
+        return content
+
+
+async def _async_iter(items):
+    for item in items:
+        yield item
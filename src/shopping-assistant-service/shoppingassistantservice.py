@@ -14,103 +14,185 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 from google.cloud import secretmanager_v1
 from urllib.parse import unquote
-from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from flask import Flask, request
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from flask import Flask, Response, request, stream_with_context
 
 from langchain_google_alloydb_pg import AlloyDBEngine, AlloyDBVectorStore
 
-PROJECT_ID = os.environ["PROJECT_ID"]
-REGION = os.environ["REGION"]
-ALLOYDB_DATABASE_NAME = os.environ["ALLOYDB_DATABASE_NAME"]
-ALLOYDB_TABLE_NAME = os.environ["ALLOYDB_TABLE_NAME"]
-ALLOYDB_CLUSTER_NAME = os.environ["ALLOYDB_CLUSTER_NAME"]
-ALLOYDB_INSTANCE_NAME = os.environ["ALLOYDB_INSTANCE_NAME"]
-ALLOYDB_SECRET_NAME = os.environ["ALLOYDB_SECRET_NAME"]
-
-secret_manager_client = secretmanager_v1.SecretManagerServiceClient()
-secret_name = secret_manager_client.secret_version_path(project=PROJECT_ID, secret=ALLOYDB_SECRET_NAME, secret_version="latest")
-secret_request = secretmanager_v1.AccessSecretVersionRequest(name=secret_name)
-secret_response = secret_manager_client.access_secret_version(request=secret_request)
-PGPASSWORD = secret_response.payload.data.decode("UTF-8").strip()
-
-engine = AlloyDBEngine.from_instance(
-    project_id=PROJECT_ID,
-    region=REGION,
-    cluster=ALLOYDB_CLUSTER_NAME,
-    instance=ALLOYDB_INSTANCE_NAME,
-    database=ALLOYDB_DATABASE_NAME,
-    user="postgres",
-    password=PGPASSWORD
+from deferred import Deferred, NotReady
+from embedding_cache import CachedEmbeddings, MmapEmbeddingStore
+from llm_clients import new_chat_model_pool
+from local_vector_index import LocalVectorIndex, alloydb_loader, file_loader
+from rag import DesignPipeline, DesignRequest
+from ttl_cache import TTLCache
+
+# "alloydb" searches the AlloyDB table, "local" an in-memory copy of it
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "alloydb")
+LOCAL_VECTOR_INDEX_FILE = os.environ.get("LOCAL_VECTOR_INDEX_FILE", "")
+LOCAL_VECTOR_INDEX_REFRESH_SECONDS = float(os.environ.get("LOCAL_VECTOR_INDEX_REFRESH_SECONDS", "300"))
+if VECTOR_STORE not in ("alloydb", "local"):
+    raise Exception(f'unknown VECTOR_STORE "{VECTOR_STORE}", expected alloydb or local')
+
+# Cached so that a retry after a failed vector store setup reuses the engine
+@functools.lru_cache(maxsize=None)
+def new_alloydb_engine():
+    project_id = os.environ["PROJECT_ID"]
+    secret_manager_client = secretmanager_v1.SecretManagerServiceClient()
+    secret_name = secret_manager_client.secret_version_path(project=project_id, secret=os.environ["ALLOYDB_SECRET_NAME"], secret_version="latest")
+    secret_request = secretmanager_v1.AccessSecretVersionRequest(name=secret_name)
+    secret_response = secret_manager_client.access_secret_version(request=secret_request)
+    pgpassword = secret_response.payload.data.decode("UTF-8").strip()
+
+    return AlloyDBEngine.from_instance(
+        project_id=project_id,
+        region=os.environ["REGION"],
+        cluster=os.environ["ALLOYDB_CLUSTER_NAME"],
+        instance=os.environ["ALLOYDB_INSTANCE_NAME"],
+        database=os.environ["ALLOYDB_DATABASE_NAME"],
+        user="postgres",
+        password=pgpassword
+    )
+
+# Cache embeddings of repeated queries in memory and, optionally, on disk
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "")
+embedding_service = CachedEmbeddings(
+    GoogleGenerativeAIEmbeddings(model="models/embedding-001"),
+    maxsize=EMBEDDING_CACHE_SIZE,
+    store=MmapEmbeddingStore(EMBEDDING_CACHE_PATH) if EMBEDDING_CACHE_PATH else None
 )
 
-# Create a synchronous connection to our vectorstore
-vectorstore = AlloyDBVectorStore.create_sync(
-    engine=engine,
-    table_name=ALLOYDB_TABLE_NAME,
-    embedding_service=GoogleGenerativeAIEmbeddings(model="models/embedding-001"),
-    id_column="id",
-    content_column="description",
-    embedding_column="product_embedding",
-    metadata_columns=["id", "name", "categories"]
-)
+def new_vectorstore():
+    if VECTOR_STORE == "local":
+        # Search an in-memory copy of the product table, see README.md
+        if LOCAL_VECTOR_INDEX_FILE:
+            loader = file_loader(LOCAL_VECTOR_INDEX_FILE, embedding_service)
+        else:
+            loader = alloydb_loader(new_alloydb_engine(), os.environ["ALLOYDB_TABLE_NAME"])
+        store = LocalVectorIndex(embedding_service, loader, refresh_seconds=LOCAL_VECTOR_INDEX_REFRESH_SECONDS)
+        store.start()
+        return store
+    # Create a synchronous connection to our vectorstore
+    return AlloyDBVectorStore.create_sync(
+        engine=new_alloydb_engine(),
+        table_name=os.environ["ALLOYDB_TABLE_NAME"],
+        embedding_service=embedding_service,
+        id_column="id",
+        content_column="description",
+        embedding_column="product_embedding",
+        metadata_columns=["id", "name", "categories"]
+    )
+
+# Connecting to AlloyDB takes seconds, so it happens in the background once
+# the app is created; requests get a 503 until it is done, see README.md
+vectorstore = Deferred("vector store", new_vectorstore)
+
+# Run the vision call and the vector search concurrently, see README.md
+RAG_PARALLEL = os.environ.get("RAG_PARALLEL", "0") == "1"
+RAG_CANDIDATES = int(os.environ.get("RAG_CANDIDATES", "12"))
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "4"))
+
+# Size of the product list in the final prompt, see README.md
+RAG_CONTEXT_DESCRIPTION_CHARS = int(os.environ.get("RAG_CONTEXT_DESCRIPTION_CHARS", "300"))
+RAG_CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", "1000"))
+
+def new_pipeline(llms, executor=None):
+    """The RAG pipeline shared by the Flask and ASGI apps, see rag.py."""
+    description_cache, answer_cache = new_response_caches()
+    return DesignPipeline(
+        llms, embedding_service, vectorstore, description_cache, answer_cache,
+        executor=executor,
+        parallel=RAG_PARALLEL,
+        candidates=RAG_CANDIDATES,
+        top_k=RAG_TOP_K,
+        context_description_chars=RAG_CONTEXT_DESCRIPTION_CHARS,
+        context_token_budget=RAG_CONTEXT_TOKEN_BUDGET,
+    )
+
+def wants_stream():
+    """True if the client asked for server-sent events instead of JSON."""
+    return bool(request.json.get('stream')) or request.accept_mimetypes.best == "text/event-stream"
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+SSE_DONE = "event: done\ndata: {}\n\n"
+SSE_ERROR = f"event: error\ndata: {json.dumps({'error': 'generation failed'})}\n\n"
+
+def sse_data(piece):
+    return f"data: {json.dumps({'content': piece})}\n\n"
+
+def sse_events(pieces):
+    """Forwards pieces of model output as server-sent events.
+
+    Each piece is sent as a `data:` event holding {"content": ...}; the
+    stream ends with a `done` event, or an `error` event if the model call
+    fails midway.
+    """
+    try:
+        for piece in pieces:
+            if piece:
+                yield sse_data(piece)
+    except Exception as e:
+        print(f"Streaming failed: {e}")
+        yield SSE_ERROR
+        return
+    yield SSE_DONE
+
+def sse_response(pieces):
+    return Response(
+        stream_with_context(sse_events(pieces)),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+def new_response_caches():
+    """Room descriptions keyed by image hash, answers by image hash and prompt."""
+    description_cache = TTLCache(
+        maxsize=int(os.environ.get("DESCRIPTION_CACHE_SIZE", "256")),
+        ttl=float(os.environ.get("DESCRIPTION_CACHE_TTL_SECONDS", "3600")))
+    answer_cache = TTLCache(
+        maxsize=int(os.environ.get("ANSWER_CACHE_SIZE", "256")),
+        ttl=float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "600")))
+    return description_cache, answer_cache
+
+def readiness():
+    """Body and status code of the readiness endpoint."""
+    if vectorstore.ready:
+        return {'status': 'ready'}, 200
+    body = {'status': 'starting'}
+    if vectorstore.last_error is not None:
+        body['error'] = str(vectorstore.last_error)
+    return body, 503
+
+def not_ready(e):
+    return {'error': str(e)}, 503, {'Retry-After': '5'}
 
 def create_app():
     app = Flask(__name__)
+    vectorstore.start()
+    app.register_error_handler(NotReady, not_ready)
+    app.add_url_rule("/ready", "ready", readiness)
+
+    # Long-lived clients shared by all requests, instead of new clients
+    # (and new connections) per request.
+    llms = new_chat_model_pool()
+    rag_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("RAG_EXECUTOR_WORKERS", "16")))
+    pipeline = new_pipeline(llms, executor=rag_executor)
 
     @app.route("/", methods=['POST'])
     def talkToGemini():
         print("Beginning RAG call")
-        prompt = request.json['message']
-        prompt = unquote(prompt)
-
-        # Step 1 – Get a room description from Gemini-vision-pro
-        llm_vision = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
-        message = HumanMessage(
-            content=[
-                {
-                    "type": "text",
-                    "text": "You are a professional interior designer, give me a detailed decsription of the style of the room in this image",
-                },
-                {"type": "image_url", "image_url": request.json['image']},
-            ]
-        )
-        response = llm_vision.invoke([message])
-        print("Description step:")
-        print(response)
-        description_response = response.content
-
-        # Step 2 – Similarity search with the description & user prompt
-        vector_search_prompt = f""" This is the user's request: {prompt} Find the most relevant items for that prompt, while matching style of the room described here: {description_response} """
-        print(vector_search_prompt)
-
-        docs = vectorstore.similarity_search(vector_search_prompt)
-        print(f"Vector search: {description_response}")
-        print(f"Retrieved documents: {len(docs)}")
-        #Prepare relevant documents for inclusion in final prompt
-        relevant_docs = ""
-        for doc in docs:
-            doc_details = doc.to_json()
-            print(f"Adding relevant document to prompt context: {doc_details}")
-            relevant_docs += str(doc_details) + ", "
-
-        # Step 3 – Tie it all together by augmenting our call to Gemini-pro
-        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
-        design_prompt = (
-            f" You are an interior designer that works for Online Boutique. You are tasked with providing recommendations to a customer on what they should add to a given room from our catalog. This is the description of the room: \n"
-            f"{description_response} Here are a list of products that are relevant to it: {relevant_docs} Specifically, this is what the customer has asked for, see if you can accommodate it: {prompt} Start by repeating a brief description of the room's design to the customer, then provide your recommendations. Do your best to pick the most relevant item out of the list of products provided, but if none of them seem relevant, then say that instead of inventing a new product. At the end of the response, add a list of the IDs of the relevant products in the following format for the top 3 results: [<first product ID>], [<second product ID>], [<third product ID>] ")
-        print("Final design prompt: ")
-        print(design_prompt)
-        design_response = llm.invoke(
-            design_prompt
-        )
-
-        data = {'content': design_response.content}
-        return data
+        prompt = unquote(request.json['message'])
+        design_request = DesignRequest(prompt, request.json['image'])
+        if wants_stream():
+            return sse_response(pipeline.answer(design_request, stream=True))
+        return {'content': pipeline.answer(design_request)}
 
     return app
 
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib
+import threading
+
+import pytest
+
+from deferred import Deferred, NotReady
+
+
+class FlakyFactory:
+    """Fails `failures` times, then returns "store"; blocks while `gate` is clear."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self):
+        self.gate.wait(5)
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError(f"attempt {self.calls} failed")
+        return "store"
+
+
+def test_get_raises_until_ready():
+    factory = FlakyFactory()
+    factory.gate.clear()
+    deferred = Deferred("store", factory).start()
+    with pytest.raises(NotReady, match="store is not ready"):
+        deferred.get()
+    assert not deferred.ready
+    factory.gate.set()
+    assert deferred.get(timeout=5) == "store"
+    assert deferred.ready
+
+
+def test_retries_until_factory_succeeds():
+    factory = FlakyFactory(failures=3)
+    deferred = Deferred("store", factory, initial_backoff=0.001, max_backoff=0.002)
+    assert deferred.start() is deferred.start()
+    assert deferred.get(timeout=5) == "store"
+    assert (factory.calls, deferred.attempts, deferred.last_error) == (4, 4, None)
+
+
+def test_keeps_last_error_while_retrying():
+    factory = FlakyFactory(failures=100)
+    deferred = Deferred("store", factory, initial_backoff=0.001, max_backoff=0.001).start()
+    with pytest.raises(NotReady):
+        deferred.get(timeout=0.05)
+    assert isinstance(deferred.last_error, ConnectionError)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    service = importlib.import_module("shoppingassistantservice")
+    factory = FlakyFactory(failures=1)
+    factory.gate.clear()
+    monkeypatch.setattr(service, "vectorstore", Deferred("vector store", factory, initial_backoff=0.001))
+    service.factory = factory
+    yield service
+    # Let the background thread finish
+    factory.failures = 0
+    factory.gate.set()
+
+
+def test_ready_endpoint(service):
+    client = service.create_app().test_client()
+    response = client.get("/ready")
+    assert (response.status_code, response.json) == (503, {"status": "starting"})
+
+    service.factory.gate.set()
+    service.vectorstore.get(timeout=5)
+    response = client.get("/ready")
+    assert (response.status_code, response.json) == (200, {"status": "ready"})
+
+
+def test_ready_endpoint_reports_last_error(service):
+    service.factory.gate.set()
+    service.factory.failures = 100
+    client = service.create_app().test_client()
+    with pytest.raises(NotReady):
+        service.vectorstore.get(timeout=0.05)
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.json["error"].startswith("attempt ")
+
+
+def test_requests_fail_fast_until_ready(service):
+    client = service.create_app().test_client()
+    response = client.post("/", json={"message": "a lamp", "image": "room.jpg"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert response.json == {"error": "vector store is not ready"}
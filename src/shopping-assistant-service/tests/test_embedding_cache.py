@@ -0,0 +1,75 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+
+from embedding_cache import MmapEmbeddingStore, text_key
+
+CHAIR = text_key("chair", "query")
+LAMP = text_key("lamp", "query")
+
+
+def test_stores_sharing_a_file_see_each_others_records(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    first, second = MmapEmbeddingStore(path), MmapEmbeddingStore(path)
+    first.put(CHAIR, [1.0, 2.0])
+    second.put(LAMP, [3.0, 4.0, 5.0])
+    assert first.get(CHAIR) == [1.0, 2.0]
+    assert first.get(LAMP) == [3.0, 4.0, 5.0]
+    assert second.get(CHAIR) == [1.0, 2.0]
+    first.close()
+    second.close()
+
+    reopened = MmapEmbeddingStore(path)
+    assert reopened.get(CHAIR) == [1.0, 2.0]
+    assert reopened.get(LAMP) == [3.0, 4.0, 5.0]
+
+
+def test_partial_record_is_dropped(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    store = MmapEmbeddingStore(path)
+    store.put(CHAIR, [1.0, 2.0])
+    store.close()
+    with open(path, "ab") as f:
+        f.write(b"\0" * 10)
+
+    store = MmapEmbeddingStore(path)
+    store.put(LAMP, [3.0])
+    store.close()
+    store = MmapEmbeddingStore(path)
+    assert store.get(CHAIR) == [1.0, 2.0]
+    assert store.get(LAMP) == [3.0]
+
+
+def _put_many(path, worker):
+    store = MmapEmbeddingStore(path)
+    for i in range(100):
+        store.put(text_key(f"{worker}-{i}", "query"), [float(worker), float(i)])
+    store.close()
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    processes = [multiprocessing.Process(target=_put_many, args=(path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    store = MmapEmbeddingStore(path)
+    for worker in range(4):
+        for i in range(100):
+            assert store.get(text_key(f"{worker}-{i}", "query")) == [float(worker), float(i)]
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+
+import numpy as np
+from langchain_core.documents import Document
+
+from local_vector_index import LocalVectorIndex, file_loader
+
+
+class AxisEmbeddings:
+    """Embeds a text as the unit vector of its first letter (a, b or c)."""
+
+    def embed_query(self, text):
+        vector = [0.0, 0.0, 0.0]
+        vector["abc".index(text[0])] = 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def product(product_id, embedding):
+    doc = Document(page_content=product_id, metadata={"id": product_id, "name": product_id, "categories": ""})
+    return doc, embedding
+
+
+def new_index(products, **kwargs):
+    index = LocalVectorIndex(AxisEmbeddings(), lambda: iter(products), **kwargs)
+    index.refresh()
+    return index
+
+
+def test_ranks_by_cosine_similarity():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(50, 8))
+    index = new_index([product(str(i), vector.tolist()) for i, vector in enumerate(vectors)])
+    query = rng.normal(size=8)
+    results = index.similarity_search_with_score_by_vector(query.tolist(), k=5)
+
+    cosines = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    expected = np.argsort(-cosines)[:5]
+    assert [doc.metadata["id"] for doc, _ in results] == [str(i) for i in expected]
+    assert np.allclose([score for _, score in results], cosines[expected], atol=1e-5)
+
+
+def test_reads_pgvector_text_and_returns_all_when_k_is_large():
+    index = new_index([product("x", "[1,0,0]"), product("y", "[0,2,0]"), product("zero", [0, 0, 0])])
+    assert len(index) == 3
+    assert [doc.page_content for doc in index.similarity_search("b", k=10)] == ["y", "x", "zero"]
+    assert index.similarity_search("b", k=0) == []
+
+
+def test_async_search_matches_sync_search():
+    index = new_index([product("x", [1, 0, 0]), product("y", [0, 1, 0])])
+    assert asyncio.run(index.asimilarity_search("a", k=1)) == index.similarity_search("a", k=1)
+
+
+def test_empty_index():
+    index = new_index([])
+    assert len(index) == 0
+    assert index.similarity_search("a") == []
+
+
+def test_failed_reload_keeps_index():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) > 1:
+            raise RuntimeError("database unavailable")
+        return iter([product("x", [1, 0, 0])])
+
+    index = LocalVectorIndex(AxisEmbeddings(), loader, refresh_seconds=0.01)
+    index.start()
+    try:
+        while len(calls) < 3:
+            index._stop.wait(0.01)
+    finally:
+        index.stop()
+    assert [doc.page_content for doc in index.similarity_search("a")] == ["x"]
+
+
+def test_file_loader_embeds_missing_embeddings(tmp_path):
+    path = tmp_path / "products.jsonl"
+    rows = [
+        {"id": "1", "name": "Lamp", "categories": "lighting", "description": "a lamp"},
+        {"id": "2", "name": "Bed", "categories": "bedroom", "description": "a bed", "product_embedding": [0, 1, 0]},
+    ]
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows) + "\n")
+    loaded = list(file_loader(str(path), AxisEmbeddings())())
+    assert [(doc.metadata, embedding) for doc, embedding in loaded] == [
+        ({"id": "1", "name": "Lamp", "categories": "lighting"}, [1.0, 0.0, 0.0]),
+        ({"id": "2", "name": "Bed", "categories": "bedroom"}, [0, 1, 0]),
+    ]
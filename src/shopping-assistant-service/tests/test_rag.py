@@ -0,0 +1,214 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from rag import DesignPipeline, DesignRequest, build_context, estimate_tokens, truncate
+from ttl_cache import TTLCache
+
+
+class SearchFailed(Exception):
+    pass
+
+
+class FakeLLM:
+    """Describes every room as "cosy" and answers "[1]" in two pieces."""
+
+    def __init__(self, started=None, release=None):
+        self.started = started or threading.Event()
+        self.release = release
+        self.cancelled = False
+
+    def get(self):
+        return self
+
+    def invoke(self, messages):
+        self.started.set()
+        if self.release is not None:
+            self.release.wait(5)
+        if isinstance(messages, list):
+            return SimpleNamespace(content="cosy")
+        return SimpleNamespace(content="[1]")
+
+    def stream(self, prompt):
+        for piece in ("[", "1]"):
+            yield SimpleNamespace(content=piece)
+
+    async def ainvoke(self, messages):
+        self.started.set()
+        if self.release is not None:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        return self.invoke(messages)
+
+
+class FakeStore:
+    """Raises SearchFailed if `fail`, once `wait_for` is set if given."""
+
+    def __init__(self, fail=False, wait_for=None):
+        self.fail = fail
+        self.wait_for = wait_for
+        self.queries = []
+
+    def get(self):
+        return self
+
+    def similarity_search(self, query, k=4):
+        self.queries.append(query)
+        if self.wait_for is not None:
+            self.wait_for.wait(5)
+        if self.fail:
+            raise SearchFailed(query)
+        return [SimpleNamespace(page_content="a lamp", metadata={"id": "1", "name": "Lamp", "categories": "lighting"})]
+
+    async def asimilarity_search(self, query, k=4):
+        # Let the description task start first
+        await asyncio.sleep(0)
+        return self.similarity_search(query, k)
+
+
+class FakeEmbeddings:
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return self.embed_query(text)
+
+
+def new_pipeline(llm, store, **kwargs):
+    return DesignPipeline(llm, FakeEmbeddings(), store, TTLCache(), TTLCache(), **kwargs)
+
+
+def test_answer_is_cached():
+    store = FakeStore()
+    pipeline = new_pipeline(FakeLLM(), store)
+    request = DesignRequest("a lamp", "room.jpg")
+    assert pipeline.answer(request) == "[1]"
+    assert pipeline.answer(DesignRequest("a lamp", "room.jpg")) == "[1]"
+    assert len(store.queries) == 1
+    assert pipeline.description_cache.get(request.image_key) == "cosy"
+
+
+def test_streamed_answer_is_cached_once_complete():
+    pipeline = new_pipeline(FakeLLM(), FakeStore())
+    request = DesignRequest("a lamp", "room.jpg")
+    pieces = pipeline.answer(request, stream=True)
+    assert pipeline.answer_cache.get(request.answer_key) is None
+    assert list(pieces) == ["[", "1]"]
+    assert list(pipeline.answer(request, stream=True)) == ["[1]"]
+
+
+def test_failed_search_keeps_running_description_for_retry():
+    release = threading.Event()
+    llm = FakeLLM(release=release)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The search fails once the vision call is running, so that it can
+        # no longer be cancelled.
+        store = FakeStore(fail=True, wait_for=llm.started)
+        pipeline = new_pipeline(llm, store, executor=executor, parallel=True)
+        request = DesignRequest("a lamp", "room.jpg")
+        with pytest.raises(SearchFailed):
+            pipeline.answer(request)
+        assert pipeline.description_cache.get(request.image_key) is None
+        release.set()
+    assert pipeline.description_cache.get(request.image_key) == "cosy"
+
+
+def test_failed_search_cancels_queued_description():
+    release = threading.Event()
+    busy = FakeLLM(release=release)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(busy.invoke, [])
+        busy.started.wait(5)
+        llm = FakeLLM()
+        pipeline = new_pipeline(llm, FakeStore(fail=True), executor=executor, parallel=True)
+        with pytest.raises(SearchFailed):
+            pipeline.answer(DesignRequest("a lamp", "room.jpg"))
+        release.set()
+    assert not llm.started.is_set()
+
+
+def test_failed_async_search_cancels_description():
+    llm = FakeLLM(release=threading.Event())
+    pipeline = new_pipeline(llm, FakeStore(fail=True), parallel=True)
+    request = DesignRequest("a lamp", "room.jpg")
+
+    async def answer():
+        with pytest.raises(SearchFailed):
+            await pipeline.aanswer(request)
+        await asyncio.sleep(0)
+
+    asyncio.run(answer())
+    assert llm.cancelled
+    assert pipeline.description_cache.get(request.image_key) is None
+
+
+def test_async_answer_matches_sync_answer():
+    request = DesignRequest("a lamp", "room.jpg")
+    for parallel in (False, True):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            expected = new_pipeline(FakeLLM(), FakeStore(), executor=executor, parallel=parallel).answer(request)
+        actual = asyncio.run(new_pipeline(FakeLLM(), FakeStore(), parallel=parallel).aanswer(request))
+        assert actual == expected == "[1]"
+
+
+def doc(product_id, description):
+    return SimpleNamespace(page_content=description,
+                           metadata={"id": product_id, "name": "Lamp " + product_id, "categories": "lighting"})
+
+
+def test_truncate_cuts_at_word_boundary():
+    assert truncate("a  warm\n brass lamp", 100) == "a warm brass lamp"
+    assert truncate("a warm brass lamp", 12) == "a warm…"
+    assert truncate("brass", 3) == "br…"
+
+
+def test_build_context_keeps_only_product_fields():
+    context = build_context([doc("1", "A warm lamp. " * 50)], max_description_chars=40)
+    assert context.startswith("ID: 1 | Name: Lamp 1 | Categories: lighting | Description: A warm lamp.")
+    assert context.endswith("…")
+    assert len(context.split("Description: ")[1]) <= 40
+
+
+def test_build_context_stays_within_token_budget():
+    docs = [doc(str(i), "a lamp with a linen shade " * 10) for i in range(20)]
+    context = build_context(docs, max_description_chars=300, token_budget=200)
+    lines = context.split("\n")
+    assert [line.split(" | ")[0] for line in lines] == ["ID: %d" % i for i in range(len(lines))]
+    assert 0 < len(lines) < 20
+    assert sum(estimate_tokens(line) + 1 for line in lines) <= 200
+    # One more product would not have fit.
+    assert len(build_context(docs, token_budget=200 + estimate_tokens(lines[0]) + 1).split("\n")) == len(lines) + 1
+
+
+def test_build_context_keeps_first_product_over_budget():
+    context = build_context([doc("1", "lamp"), doc("2", "lamp")], token_budget=1)
+    assert context == "ID: 1 | Name: Lamp 1 | Categories: lighting | Description: lamp"
+    assert build_context([]) == ""
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+#
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+
+from ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("room", "cosy")
+    clock.now = 9.9
+    assert cache.get("room") == "cosy"
+    clock.now = 10
+    assert cache.get("room") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_set_refreshes_expiry():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("room", "cosy")
+    clock.now = 8
+    cache.set("room", "bright")
+    clock.now = 15
+    assert cache.get("room") == "bright"
+
+
+def test_zero_maxsize_disables_cache():
+    cache = TTLCache(maxsize=0)
+    cache.set("room", "cosy")
+    assert cache.get("room") is None
+
+
+def test_concurrent_use_keeps_maxsize():
+    cache = TTLCache(maxsize=50)
+
+    def use(worker):
+        for i in range(1000):
+            cache.set((worker, i), i)
+            cache.get((worker, i - 1))
+
+    threads = [threading.Thread(target=use, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(cache._entries) == 50
+    assert cache.hits + cache.misses == 8000